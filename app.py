@@ -4,56 +4,463 @@ to detect user emotions and plays YouTube/Spotify music matching the mood.
 """
 
 import os
+import atexit
 import base64
+import gc
+import importlib
+import io
 import json
+import math
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+_startup_started = time.perf_counter()
+
 import requests
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+from flask import Flask, Request, render_template, request, jsonify, session, redirect, url_for, flash, stream_with_context
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_sqlalchemy import SQLAlchemy
-import cv2
-import numpy as np
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 
+
+class StartupTimer:
+    """Wall time per startup phase, plus objects loaded lazily after startup."""
+    
+    def __init__(self, started):
+        self.started = started
+        self._last = started
+        self.phases = OrderedDict()
+        self.lazy = OrderedDict()
+    
+    def mark(self, phase):
+        """Close the phase that ran since the previous mark."""
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+    
+    def report(self):
+        def ms(seconds):
+            return round(seconds * 1000, 1)
+        return {
+            'phases_ms': {phase: ms(seconds) for phase, seconds in self.phases.items()},
+            'total_ms': ms(self._last - self.started),
+            'lazy_ms': {name: ms(seconds) for name, seconds in self.lazy.items()}
+        }
+    
+    def summary(self):
+        report = self.report()
+        phases = ', '.join(f"{phase} {ms}ms" for phase, ms in report['phases_ms'].items())
+        return f"Startup {report['total_ms']}ms ({phases})"
+
+
+class LazyGlobal:
+    """Placeholder for a module global that is expensive to build.
+    
+    The first attribute access calls factory() and rebinds the global to the
+    result, so later lookups go straight to the real object.
+    """
+    
+    def __init__(self, name, factory):
+        self._name = name
+        self._factory = factory
+        self._lock = threading.RLock()
+    
+    def load(self):
+        with self._lock:
+            value = globals()[self._name]
+            if value is self:
+                start = time.perf_counter()
+                value = self._factory()
+                startup_timer.lazy[self._name] = time.perf_counter() - start
+                globals()[self._name] = value
+            return value
+    
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+
+startup_timer = StartupTimer(_startup_started)
+startup_timer.mark('imports')
+
+# OpenCV and numpy dominate import time and only the mood routes need them
+cv2 = LazyGlobal('cv2', lambda: importlib.import_module('cv2'))
+np = LazyGlobal('np', lambda: importlib.import_module('numpy'))
+
 # Load .env file
 from dotenv import load_dotenv
 load_dotenv()
 
+# Cooperative (gevent) serving: true when async_server.py or a gevent gunicorn
+# worker has monkey-patched the standard library before importing the app, so
+# every outbound API call yields instead of holding an OS thread
+COOPERATIVE = 'gevent.monkey' in sys.modules and sys.modules['gevent.monkey'].is_module_patched('socket')
+
 # Create Flask app
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'moodmusic-secret-key-2024')
 
-# Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///moodmusic.db'
+# Database configuration: SQLite by default, any SQLAlchemy URL (e.g. Postgres)
+# through DATABASE_URL
+def get_database_url():
+    url = os.environ.get('DATABASE_URL', 'sqlite:///moodmusic.db')
+    # Heroku/Render hand out postgres:// URLs, which SQLAlchemy no longer accepts
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+DATABASE_URL = get_database_url()
+IS_SQLITE = DATABASE_URL.startswith('sqlite')
+SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', '30'))  # seconds a writer waits for the lock
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '20'))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', '10'))  # seconds
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))  # seconds
+
+app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+if IS_SQLITE:
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT}}
+else:
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True
+    }
 
 # Initialize extensions
 db = SQLAlchemy(app)
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL lets readers run alongside the single writer; NORMAL sync is safe under WAL."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}')
+    cursor.close()
+
+if IS_SQLITE:
+    with app.app_context():
+        event.listen(db.engine, 'connect', _set_sqlite_pragmas)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
 # Enable CORS for mobile access
 CORS(app)
+startup_timer.mark('app_setup')
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire ttl seconds after being set."""
+    
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+    
+    def __len__(self):
+        return len(self._entries)
+
+
+class LatencyStats:
+    """Call/error counts plus rolling latency percentiles for one operation."""
+    
+    def __init__(self, window=512):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.items = 0
+        self.total_seconds = 0.0
+        self.warmup_ms = None
+    
+    def record(self, seconds, items=1, error=False):
+        with self._lock:
+            self._samples.append(seconds)
+            self.calls += 1
+            self.items += items
+            self.total_seconds += seconds
+            if error:
+                self.errors += 1
+    
+    def percentile(self, p):
+        """Latency in seconds at quantile p (0-1) of the recent window, or None."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(int(len(samples) * p), len(samples) - 1)]
+    
+    def snapshot(self):
+        with self._lock:
+            calls, errors, items, total = self.calls, self.errors, self.items, self.total_seconds
+        
+        def ms(seconds):
+            return round(seconds * 1000, 3) if seconds is not None else None
+        
+        return {
+            'calls': calls,
+            'errors': errors,
+            'items': items,
+            'mean_ms': ms(total / calls) if calls else None,
+            'per_item_ms': ms(total / items) if items else None,
+            'p50_ms': ms(self.percentile(0.5)),
+            'p95_ms': ms(self.percentile(0.95)),
+            'warmup_ms': self.warmup_ms
+        }
+
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one; the others wait and share its result."""
+    
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.merged = 0
+    
+    def run(self, key, fn, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+            else:
+                self.merged += 1
+        if not leader:
+            return call.result()
+        try:
+            result = fn(*args)
+            call.set_result(result)
+            return result
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+    
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
 
 # Spotify API Configuration
 SPOTIFY_CLIENT_ID = os.environ.get('SPOTIFY_CLIENT_ID', '')
 SPOTIFY_CLIENT_SECRET = os.environ.get('SPOTIFY_CLIENT_SECRET', '')
 SPOTIFY_AUTH_URL = 'https://accounts.spotify.com/authorize'
-SPOTIFY_TOKEN_URL = 'https://accounts.spotify.com/api/token'
-SPOTIFY_API_URL = 'https://api.spotify.com/v1'
+SPOTIFY_TOKEN_URL = os.environ.get('SPOTIFY_TOKEN_URL', 'https://accounts.spotify.com/api/token')
+SPOTIFY_API_URL = os.environ.get('SPOTIFY_API_URL', 'https://api.spotify.com/v1')
 
 # YouTube API Configuration
 YOUTUBE_API_KEY = os.environ.get('YOUTUBE_API_KEY', '')
-YOUTUBE_SEARCH_URL = 'https://www.googleapis.com/youtube/v3/search'
+YOUTUBE_API_URL = os.environ.get('YOUTUBE_API_URL', 'https://www.googleapis.com/youtube/v3')
+YOUTUBE_SEARCH_URL = f'{YOUTUBE_API_URL}/search'
 
 # Google OAuth Configuration
 GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID', '')
 GOOGLE_CLIENT_SECRET = os.environ.get('GOOGLE_CLIENT_SECRET', '')
 GOOGLE_REDIRECT_URI = os.environ.get('GOOGLE_REDIRECT_URI', 'http://127.0.0.1:5000/google_callback')
 GOOGLE_AUTH_URL = 'https://accounts.google.com/o/oauth2/v2/auth'
-GOOGLE_TOKEN_URL = 'https://oauth2.googleapis.com/token'
-GOOGLE_USERINFO_URL = 'https://www.googleapis.com/oauth2/v2/userinfo'
+GOOGLE_TOKEN_URL = os.environ.get('GOOGLE_TOKEN_URL', 'https://oauth2.googleapis.com/token')
+GOOGLE_USERINFO_URL = os.environ.get('GOOGLE_USERINFO_URL', 'https://www.googleapis.com/oauth2/v2/userinfo')
+
+# Outbound HTTP: one keep-alive session with a connection pool per host
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '3.05'))  # seconds
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '10'))  # seconds
+HTTP_POOL_HOSTS = int(os.environ.get('HTTP_POOL_HOSTS', '10'))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '200' if COOPERATIVE else '20'))  # connections kept per host
+
+# Each host gets a circuit breaker: after HTTP_BREAKER_FAILURES consecutive
+# errors/timeouts/5xx, calls fail at once for HTTP_BREAKER_RESET seconds, then a
+# single probe decides whether to close it again. GETs to HTTP_HEDGE_HOSTS send
+# a duplicate request once the first has taken longer than the endpoint's p95.
+HTTP_BREAKER_FAILURES = int(os.environ.get('HTTP_BREAKER_FAILURES', '5'))
+HTTP_BREAKER_RESET = float(os.environ.get('HTTP_BREAKER_RESET', '30'))  # seconds
+HTTP_HEDGE_HOSTS = {h.strip() for h in os.environ.get('HTTP_HEDGE_HOSTS', '').split(',') if h.strip()}
+HTTP_HEDGE_MIN_DELAY = float(os.environ.get('HTTP_HEDGE_MIN_DELAY', '0.05'))  # seconds
+HTTP_HEDGE_MIN_SAMPLES = 20  # calls needed before an endpoint's p95 is trusted
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling a host whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open probe after reset_timeout."""
+    
+    def __init__(self, name, failure_threshold=HTTP_BREAKER_FAILURES, reset_timeout=HTTP_BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+    
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+    
+    def record(self, success):
+        with self._lock:
+            self._probing = False
+            if success:
+                self.state = 'closed'
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    print(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+    
+    def snapshot(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures, 'rejected': self.rejected}
+
+
+class HttpClient:
+    """Shared requests.Session with per-host keep-alive pools, default timeouts,
+    circuit breakers and latency stats per endpoint (host + path)."""
+    
+    def __init__(self, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 pool_hosts=HTTP_POOL_HOSTS, pool_size=HTTP_POOL_SIZE, hedge_hosts=HTTP_HEDGE_HOSTS):
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.hedge_hosts = hedge_hosts
+        self._hedge_pool = ThreadPoolExecutor(pool_size, thread_name_prefix='http-hedge') if hedge_hosts else None
+        self._stats = {}
+        self._breakers = {}
+        self._stats_lock = threading.Lock()
+    
+    def endpoint_stats(self, endpoint):
+        with self._stats_lock:
+            stats = self._stats.get(endpoint)
+            if stats is None:
+                stats = self._stats[endpoint] = LatencyStats()
+            return stats
+    
+    def breaker(self, host):
+        with self._stats_lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(host)
+            return breaker
+    
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        parts = urlsplit(url)
+        breaker = self.breaker(parts.netloc)
+        if not breaker.allow():
+            raise CircuitOpenError(f"{parts.netloc} circuit open")
+        stats = self.endpoint_stats(f"{parts.netloc}{parts.path}")
+        if method == 'GET' and parts.netloc in self.hedge_hosts:
+            return self._hedged(method, url, kwargs, stats, breaker)
+        return self._send(method, url, kwargs, stats, breaker)
+    
+    def _send(self, method, url, kwargs, stats, breaker):
+        start = time.perf_counter()
+        error = True
+        try:
+            response = self.session.request(method, url, **kwargs)
+            error = response.status_code >= 500
+            return response
+        finally:
+            stats.record(time.perf_counter() - start, error=error)
+            breaker.record(not error)
+    
+    def _hedged(self, method, url, kwargs, stats, breaker):
+        """Send a second copy if the first is slower than the endpoint's p95; first answer wins."""
+        p95 = stats.percentile(0.95) if stats.calls >= HTTP_HEDGE_MIN_SAMPLES else None
+        if p95 is None:
+            return self._send(method, url, kwargs, stats, breaker)
+        first = self._hedge_pool.submit(self._send, method, url, kwargs, stats, breaker)
+        try:
+            return first.result(timeout=max(p95, HTTP_HEDGE_MIN_DELAY))
+        except FutureTimeoutError:
+            pass
+        second = self._hedge_pool.submit(self._send, method, url, kwargs, stats, breaker)
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None or not pending:
+                    response = future.result()
+                    response.hedged = True
+                    return response
+    
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+    
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+    
+    def stats(self):
+        with self._stats_lock:
+            endpoints = dict(self._stats)
+            breakers = dict(self._breakers)
+        return (
+            {endpoint: stats.snapshot() for endpoint, stats in endpoints.items()},
+            {host: breaker.snapshot() for host, breaker in breakers.items()}
+        )
+
+
+http_client = HttpClient()
 
 # Fallback videos (works without API key) - Extended with more variety for each mood
 FALLBACK_VIDEOS = {
@@ -295,14 +702,15 @@ TIME_PERIODS = [
     '2025-01-01T00:00:00Z',  # This year so far
 ]
 
+# Base query, modifier and time filter all rotate on this window, so repeated
+# searches for a mood within a window share a cache entry
+QUERY_WINDOW_SECONDS = 300
 
-def generate_dynamic_query(mood):
+
+def generate_dynamic_query(mood, now=None):
     """Generate a dynamic AI-powered query for YouTube search."""
-    import random
-    import time
-    
     # Get current timestamp for randomness
-    current_time = int(time.time())
+    current_time = int(time.time()) if now is None else int(now)
     
     # Get mood variations
     variations = MOOD_QUERY_VARIATIONS.get(mood, MOOD_QUERY_VARIATIONS['neutral'])
@@ -312,11 +720,12 @@ def generate_dynamic_query(mood):
     minute_of_day = (current_time // 60) % (24 * 60)
     
     # Select base query based on time for variety
-    base_index = (current_time // 300) % len(variations)  # Changes every 5 minutes
+    window = current_time // QUERY_WINDOW_SECONDS
+    base_index = window % len(variations)  # Changes every 5 minutes
     base_query = variations[base_index]
     
-    # Add random modifier
-    modifier = SEARCH_MODIFIERS[current_time % len(SEARCH_MODIFIERS)]
+    # Add modifier, rotating with the same window
+    modifier = SEARCH_MODIFIERS[window % len(SEARCH_MODIFIERS)]
     
     # Build final query
     if modifier:
@@ -327,19 +736,22 @@ def generate_dynamic_query(mood):
     return query
 
 
+def window_time_period(now=None):
+    """Time filter for the current query window."""
+    current_time = int(time.time()) if now is None else int(now)
+    return TIME_PERIODS[(current_time // QUERY_WINDOW_SECONDS) % len(TIME_PERIODS)]
+
+
 def get_search_params(mood):
     """Get search parameters with dynamic query and time period."""
-    import random
-    import time
-    
     current_time = int(time.time())
     
     # Generate dynamic query
-    query = generate_dynamic_query(mood)
+    query = generate_dynamic_query(mood, current_time)
     
     # Randomly select time period for freshness (70% chance of recent content)
     if random.random() < 0.7:
-        time_period = TIME_PERIODS[current_time % len(TIME_PERIODS)]
+        time_period = window_time_period(current_time)
     else:
         time_period = None  # No time restriction for maximum variety
     
@@ -355,6 +767,7 @@ class User(UserMixin, db.Model):
     youtube_api_key = db.Column(db.String(200), nullable=True)
     spotify_token = db.Column(db.Text, nullable=True)
     spotify_refresh_token = db.Column(db.Text, nullable=True)
+    spotify_token_expires_at = db.Column(db.Float, nullable=True)  # unix time; None for tokens stored before expiry was tracked
     preferred_mood = db.Column(db.String(50), default='neutral')
     music_service = db.Column(db.String(20), default='youtube')  # 'youtube' or 'spotify'
     user_interests = db.Column(db.Text, nullable=True)  # JSON string of user's YouTube interests
@@ -367,106 +780,746 @@ class Playlist(db.Model):
     name = db.Column(db.String(100), nullable=False)
     mood = db.Column(db.String(50), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    videos = db.Column(db.Text, nullable=True)  # JSON string of video IDs
+    videos = db.Column(db.Text, nullable=True)  # Legacy JSON blob, migrated into PlaylistItem rows
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
 
+# Track metadata, shared by every playlist that contains the track
+class Track(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(20), nullable=False, default='youtube')  # 'youtube' or 'spotify'
+    external_id = db.Column(db.String(100), nullable=False)
+    title = db.Column(db.String(300), nullable=True)
+    channel = db.Column(db.String(200), nullable=True)
+    thumbnail = db.Column(db.String(500), nullable=True)
+    extra = db.Column(db.Text, nullable=True)  # JSON of any other video fields (urls, preview)
+    __table_args__ = (db.UniqueConstraint('source', 'external_id', name='uq_track_source_external_id'),)
+    
+    def to_video(self):
+        video = json.loads(self.extra) if self.extra else {}
+        video.update({
+            'id': self.external_id,
+            'title': self.title,
+            'channel': self.channel,
+            'thumbnail': self.thumbnail,
+            'type': self.source
+        })
+        return video
+
+# One row per track in a playlist, ordered by position
+class PlaylistItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    playlist_id = db.Column(db.Integer, db.ForeignKey('playlist.id'), nullable=False)
+    track_id = db.Column(db.Integer, db.ForeignKey('track.id'), nullable=False)
+    video_id = db.Column(db.String(100), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    added_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    track = db.relationship('Track', lazy='joined')
+    __table_args__ = (
+        db.UniqueConstraint('playlist_id', 'video_id', name='uq_playlist_item_video'),
+        db.Index('ix_playlist_item_position', 'playlist_id', 'position'),
+    )
+
+# Per-user interest profile: decayed term weights plus YouTube paging checkpoints
+class InterestProfile(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    weights = db.Column(db.Text, nullable=True)  # JSON {term: weight}, at most INTEREST_PROFILE_TERMS entries
+    checkpoints = db.Column(db.Text, nullable=True)  # JSON {source: {etag, page_token, seen}}
+    synced_at = db.Column(db.Float, nullable=True)  # unix time of the last sync, for decay
+    sync_status = db.Column(db.String(10), nullable=True)  # 'pending', 'ready' or 'failed'
+    sync_started_at = db.Column(db.Float, nullable=True)  # unix time the current/last sync job was queued
+
+# Number of profiles containing each term (document frequency for IDF)
+class InterestTerm(db.Model):
+    term = db.Column(db.String(100), primary_key=True)
+    profiles = db.Column(db.Integer, nullable=False, default=0)
+
+TRACK_FIELDS = ('id', 'title', 'channel', 'thumbnail', 'type')
+
+def get_or_create_track(video):
+    """Find the shared Track row for a video dict, adding it if new."""
+    source = video.get('type') or 'youtube'
+    external_id = str(video['id'])
+    track = Track.query.filter_by(source=source, external_id=external_id).first()
+    if track is None:
+        extra = {k: v for k, v in video.items() if k not in TRACK_FIELDS}
+        track = Track(
+            source=source,
+            external_id=external_id,
+            title=video.get('title'),
+            channel=video.get('channel'),
+            thumbnail=video.get('thumbnail'),
+            extra=json.dumps(extra) if extra else None
+        )
+        db.session.add(track)
+        db.session.flush()
+    return track
+
+def append_playlist_item(playlist_id, video):
+    """Add video at the end of a playlist; returns False if it is already there.
+    
+    Commits. The unique (playlist_id, video_id) constraint settles concurrent adds.
+    """
+    video_id = str(video['id'])
+    if PlaylistItem.query.filter_by(playlist_id=playlist_id, video_id=video_id).first():
+        return False
+    
+    for attempt in range(2):
+        try:
+            track = get_or_create_track(video)
+            last = db.session.query(db.func.max(PlaylistItem.position)).filter_by(playlist_id=playlist_id).scalar()
+            db.session.add(PlaylistItem(
+                playlist_id=playlist_id,
+                track_id=track.id,
+                video_id=video_id,
+                position=(last or 0) + 1
+            ))
+            db.session.commit()
+            return True
+        except IntegrityError:
+            # Someone else added the same track or item first; re-check once
+            db.session.rollback()
+            if PlaylistItem.query.filter_by(playlist_id=playlist_id, video_id=video_id).first():
+                return False
+    return False
+
+def playlist_videos(playlist_id):
+    """Videos of a playlist in order."""
+    items = PlaylistItem.query.filter_by(playlist_id=playlist_id).order_by(PlaylistItem.position).all()
+    return [item.track.to_video() for item in items]
+
+def playlists_videos(playlist_ids):
+    """Videos of several playlists in order, loaded in one query: {playlist_id: [video, ...]}."""
+    videos_by_playlist = {playlist_id: [] for playlist_id in playlist_ids}
+    if not videos_by_playlist:
+        return videos_by_playlist
+    items = PlaylistItem.query.filter(PlaylistItem.playlist_id.in_(list(videos_by_playlist))) \
+        .order_by(PlaylistItem.playlist_id, PlaylistItem.position).all()
+    for item in items:
+        videos_by_playlist[item.playlist_id].append(item.track.to_video())
+    return videos_by_playlist
+
+def playlists_summaries(playlist_ids):
+    """Track count and first thumbnail per playlist: {playlist_id: {...}}."""
+    summaries = {playlist_id: {'video_count': 0, 'thumbnail': None} for playlist_id in playlist_ids}
+    if not summaries:
+        return summaries
+    ids = list(summaries)
+    
+    counts = db.session.query(PlaylistItem.playlist_id, db.func.count(PlaylistItem.id), db.func.min(PlaylistItem.position)) \
+        .filter(PlaylistItem.playlist_id.in_(ids)).group_by(PlaylistItem.playlist_id).all()
+    first_positions = []
+    for playlist_id, count, first_position in counts:
+        summaries[playlist_id]['video_count'] = count
+        first_positions.append((playlist_id, first_position))
+    
+    if first_positions:
+        firsts = db.session.query(PlaylistItem.playlist_id, Track.thumbnail) \
+            .join(Track, Track.id == PlaylistItem.track_id) \
+            .filter(db.tuple_(PlaylistItem.playlist_id, PlaylistItem.position).in_(first_positions)).all()
+        for playlist_id, thumbnail in firsts:
+            summaries[playlist_id]['thumbnail'] = thumbnail
+    return summaries
+
+def add_missing_columns():
+    """Add model columns missing from existing tables (create_all only creates new tables)."""
+    inspector = db.inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    added = 0
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                db.session.execute(db.text(
+                    f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                    f"{preparer.format_column(column)} {column.type.compile(db.engine.dialect)}"
+                ))
+                added += 1
+    db.session.commit()
+    return added
+
+def migrate_playlist_blobs():
+    """Move legacy Playlist.videos JSON blobs into PlaylistItem rows; safe to re-run."""
+    migrated = 0
+    for playlist in Playlist.query.filter(Playlist.videos.isnot(None)).all():
+        try:
+            videos = json.loads(playlist.videos) or []
+        except ValueError:
+            videos = []
+        for video in videos:
+            if isinstance(video, dict) and video.get('id'):
+                append_playlist_item(playlist.id, video)
+        playlist.videos = None
+        db.session.commit()
+        migrated += 1
+    return migrated
+
+# Write-behind buffer for high-frequency preference updates
+PREFERENCE_FIELDS = ('preferred_mood', 'music_service')
+PREFERENCE_FLUSH_INTERVAL = float(os.environ.get('PREFERENCE_FLUSH_INTERVAL', '5'))  # seconds
+
+
+class PreferenceBuffer:
+    """Coalesces preference writes in memory and flushes them in one transaction.
+    
+    Only the latest value per (user, field) is kept. A background thread flushes
+    every PREFERENCE_FLUSH_INTERVAL seconds, and again at exit. Cached user
+    snapshots get pending values overlaid, so reads in this process see the
+    latest value.
+    """
+    
+    def __init__(self, interval=PREFERENCE_FLUSH_INTERVAL):
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+    
+    def set(self, user_id, field, value):
+        """Record a new value and update the cached snapshot of the user."""
+        if field not in PREFERENCE_FIELDS:
+            raise ValueError(f"Not a buffered preference: {field}")
+        with self._lock:
+            self._pending.setdefault(user_id, {})[field] = value
+        user_cache.update(user_id, **{field: value})
+        self._ensure_flusher()
+    
+    def overlay(self, snapshot):
+        """Return snapshot with any pending values applied."""
+        with self._lock:
+            fields = dict(self._pending.get(snapshot.id, ()))
+        return snapshot.replace(**fields) if fields else snapshot
+    
+    def flush(self):
+        """Write all pending values; returns the number of users updated."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            try:
+                with app.app_context():
+                    for user_id, fields in pending.items():
+                        db.session.execute(db.update(User).where(User.id == user_id).values(**fields))
+                    db.session.commit()
+            except Exception as e:
+                print(f"Error flushing preferences: {e}")
+                # Put the values back unless newer ones arrived meanwhile
+                with self._lock:
+                    for user_id, fields in pending.items():
+                        current = self._pending.setdefault(user_id, {})
+                        for field, value in fields.items():
+                            current.setdefault(field, value)
+                return 0
+            return len(pending)
+    
+    def _ensure_flusher(self):
+        # Threads don't survive fork, so check the owning process too
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='preference-flush', daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+preference_buffer = PreferenceBuffer()
+atexit.register(preference_buffer.flush)
+
+# Per-process cache of read-only user snapshots, so authenticated requests
+# don't query the user table. Writers call invalidate_user(); other processes
+# pick changes up once USER_CACHE_TTL expires.
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '30'))  # seconds
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+
+
+class UserSnapshot(UserMixin):
+    """Immutable copy of the User fields request handlers read."""
+    
+    FIELDS = ('id', 'username', 'email', 'google_id', 'youtube_api_key', 'spotify_token',
+              'spotify_refresh_token', 'spotify_token_expires_at', 'preferred_mood', 'music_service',
+              'user_interests')
+    __slots__ = FIELDS
+    
+    def __init__(self, **fields):
+        for field in self.FIELDS:
+            object.__setattr__(self, field, fields.get(field))
+    
+    def __setattr__(self, name, value):
+        raise AttributeError('UserSnapshot is read-only; update the User row and call invalidate_user()')
+    
+    @classmethod
+    def from_user(cls, user):
+        return cls(**{field: getattr(user, field) for field in cls.FIELDS})
+    
+    def replace(self, **changes):
+        fields = {field: getattr(self, field) for field in self.FIELDS}
+        fields.update(changes)
+        return UserSnapshot(**fields)
+
+
+class UserCache(TTLCache):
+    def update(self, user_id, **changes):
+        """Swap in an updated snapshot if the user is cached."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries[user_id] = (entry[0], entry[1].replace(**changes))
+
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+def invalidate_user(user_id):
+    user_cache.pop(user_id)
+
+def current_user_record():
+    """The mapped User row for the logged-in user, for handlers that write to it."""
+    return db.session.get(User, current_user.id)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    snapshot = user_cache.get(user_id)
+    if snapshot is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        snapshot = preference_buffer.overlay(UserSnapshot.from_user(user))
+        user_cache.set(user_id, snapshot)
+    return snapshot
+
+# Per-session mood smoothing state
+MOOD_SESSION_MAX = int(os.environ.get('MOOD_SESSION_MAX', '10000'))
+MOOD_SESSION_TTL = int(os.environ.get('MOOD_SESSION_TTL', '1800'))  # seconds
+
+# Face detection fast path: full scans run on a downscaled frame, and between
+# scans only a padded window around the last face box is searched
+FACE_DETECT_WIDTH = int(os.environ.get('FACE_DETECT_WIDTH', '320'))  # px
+FACE_RESCAN_INTERVAL = int(os.environ.get('FACE_RESCAN_INTERVAL', '10'))  # frames
+FACE_ROI_PADDING = float(os.environ.get('FACE_ROI_PADDING', '0.5'))  # fraction of face size
+FACE_ROI_WIDTH = int(os.environ.get('FACE_ROI_WIDTH', '96'))  # px the tracked face is scaled to
+
+# Change gate: a 32x32 grey thumbnail of the tracked face (the whole frame until a
+# face is tracked) is split into 4x4-pixel blocks; if no block's mean absolute difference
+# from the previous thumbnail reaches MOOD_CHANGE_THRESHOLD grey levels, the
+# previous result is reused. At most MOOD_MAX_SKIP frames in a row are skipped.
+# 0 disables.
+MOOD_CHANGE_THRESHOLD = float(os.environ.get('MOOD_CHANGE_THRESHOLD', '3.0'))
+MOOD_MAX_SKIP = int(os.environ.get('MOOD_MAX_SKIP', '15'))
+
+
+class FaceTrack:
+    """Last face box for a client and frames since the last full scan (picklable)."""
+
+    __slots__ = ('face_box', 'frames_since_scan')
+
+    def __init__(self):
+        self.face_box = None
+        self.frames_since_scan = 0
+
+
+class MoodState:
+    """Compact smoothing state for one client: history ring buffer plus last result."""
+
+    __slots__ = ('history', 'last_mood', 'mood_confidence', 'last_seen', 'lock', 'track',
+                 'thumbnail', 'last_result', 'skipped')
+
+    def __init__(self, history_size=5):
+        self.history = deque(maxlen=history_size)
+        self.last_mood = 'neutral'
+        self.mood_confidence = 0.5
+        self.last_seen = time.monotonic()
+        self.lock = threading.Lock()
+        self.track = FaceTrack()
+        self.thumbnail = None
+        self.last_result = None
+        self.skipped = 0
+
+
+class MoodStateStore:
+    """Bounded LRU/TTL map of session key -> MoodState."""
+
+    def __init__(self, max_sessions=MOOD_SESSION_MAX, ttl=MOOD_SESSION_TTL, history_size=5):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.history_size = history_size
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the state for key, creating it (and evicting stale entries) if needed."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._states.get(key)
+            if state is not None and now - state.last_seen > self.ttl:
+                del self._states[key]
+                state = None
+            if state is None:
+                state = MoodState(self.history_size)
+                self._states[key] = state
+                self._evict(now)
+            else:
+                self._states.move_to_end(key)
+            state.last_seen = now
+            return state
+
+    def discard(self, key):
+        """Forget a client's state now (its stream closed) rather than at expiry."""
+        with self._lock:
+            self._states.pop(key, None)
+
+    def _evict(self, now):
+        # Oldest entries sit at the front, so expired ones are popped first
+        while self._states:
+            oldest = next(iter(self._states.values()))
+            if len(self._states) > self.max_sessions or now - oldest.last_seen > self.ttl:
+                self._states.popitem(last=False)
+            else:
+                break
+
+    def __len__(self):
+        return len(self._states)
+
+
+
+# Change gate and smoothing run in the web process and only touch MoodState, so
+# they don't need the cascades or classifiers (which may live in a process pool)
+THUMBNAIL_SIZE = 32
+THUMBNAIL_BLOCK = 4
+
+def frame_thumbnail(frame, face_box=None):
+    """Tiny grey thumbnail of the face box (or whole frame) used to spot unchanged frames."""
+    if face_box is not None:
+        x, y, w, h = face_box
+        face = frame[max(y, 0):y + h, max(x, 0):x + w]
+        if face.size:
+            frame = face
+    small = cv2.resize(frame, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = small.mean(axis=2)
+    return small.astype(np.float32)
+
+def thumbnail_change(a, b):
+    """Largest per-block mean absolute difference, so a local change (the mouth) isn't averaged away."""
+    blocks = THUMBNAIL_SIZE // THUMBNAIL_BLOCK
+    diff = np.abs(a - b).reshape(blocks, THUMBNAIL_BLOCK, blocks, THUMBNAIL_BLOCK)
+    return float(diff.mean(axis=(1, 3)).max())
+
+def cached_mood_result(state, thumbnail):
+    """Previous result for state if the frame hasn't materially changed, else None."""
+    if MOOD_CHANGE_THRESHOLD <= 0:
+        return None
+    with state.lock:
+        if state.last_result is None or state.thumbnail is None or state.skipped >= MOOD_MAX_SKIP:
+            return None
+        if thumbnail_change(thumbnail, state.thumbnail) >= MOOD_CHANGE_THRESHOLD:
+            return None
+        state.skipped += 1
+        return dict(state.last_result, cached=True)
+
+def remember_mood_result(state, thumbnail, result):
+    with state.lock:
+        state.thumbnail = thumbnail
+        state.last_result = result
+        state.skipped = 0
+
+def smooth_mood(state, mood, confidence):
+    """Fold a raw per-frame mood into the client's smoothing window."""
+    with state.lock:
+        state.history.append(mood)
+        
+        if len(state.history) >= 3:
+            mood_counts = Counter(state.history)
+            most_common = mood_counts.most_common(1)[0][0]
+            if mood_counts[most_common] >= 2:
+                mood = most_common
+        
+        state.last_mood = mood
+        state.mood_confidence = confidence
+    
+    return {'mood': mood, 'confidence': confidence}
+
+def apply_inference(raw, tracks, states):
+    """Store updated tracks and smooth raw results into each client's state."""
+    results = []
+    for found, track, state in zip(raw, tracks, states):
+        state.track = track
+        if found is None:
+            results.append({'mood': state.last_mood, 'confidence': 0.3, 'face_detected': False})
+            continue
+        emotion_data = smooth_mood(state, found['mood'], found['confidence'])
+        emotion_data['face_detected'] = True
+        emotion_data['face_coords'] = found['face_coords']
+        emotion_data['eyes_detected'] = found['eyes_detected']
+        results.append(emotion_data)
+    return results
+
+mood_states = MoodStateStore()
+
+def get_mood_session_key(data=None):
+    """Key used for per-client mood state: explicit client_id, else a cookie-session id."""
+    client_id = data.get('client_id') if isinstance(data, dict) else None
+    if client_id:
+        return f"client:{client_id}"
+    sid = session.get('mood_sid')
+    if not sid:
+        sid = secrets.token_urlsafe(16)
+        session['mood_sid'] = sid
+    return f"session:{sid}"
+
+
+MOOD_LABELS = ('neutral', 'happy', 'sad', 'angry', 'fear', 'surprise', 'disgust')
+
+# Emotion classifier backends. Each takes an (N, 48, 48) uint8 grey face stack
+# and returns (moods, confidences); MOOD_CLASSIFIER picks the active one.
+MOOD_CLASSIFIER = os.environ.get('MOOD_CLASSIFIER', 'heuristic')
+MOOD_MODEL_PATH = os.environ.get('MOOD_MODEL_PATH', '')  # ONNX/Caffe/TF model readable by cv2.dnn
+MOOD_MODEL_SIZE = int(os.environ.get('MOOD_MODEL_SIZE', '48'))  # square input side in px
+MOOD_MODEL_SCALE = float(os.environ.get('MOOD_MODEL_SCALE', str(1 / 255.0)))
+# Output order of the model; defaults to the FER2013 class order
+MOOD_MODEL_LABELS = os.environ.get('MOOD_MODEL_LABELS', 'angry,disgust,fear,happy,sad,surprise,neutral')
+
+# Label spellings used by common FER models -> our mood names
+MODEL_LABEL_ALIASES = {
+    'anger': 'angry', 'happiness': 'happy', 'sadness': 'sad',
+    'contempt': 'disgust', 'surprised': 'surprise', 'fearful': 'fear'
+}
+
+
+class HeuristicClassifier:
+    """Hand-tuned brightness/contrast/edge rules; no model file needed."""
+    
+    name = 'heuristic'
+    
+    def __init__(self):
+        self.latency = LatencyStats()
+    
+    def predict(self, faces):
+        return self.classify_features(self.extract_features(faces))
+    
+    def extract_features(self, faces):
+        """Brightness/contrast/edge/mouth statistics for an (N, 48, 48) uint8 face stack."""
+        faces = np.asarray(faces, dtype=np.uint8)
+        n, h, w = faces.shape
+        pixels = faces.astype(np.float32)
+        normalized = pixels / 255.0
+        
+        upper_mean = pixels[:, :h//2, :].mean(axis=(1, 2))
+        lower_mean = pixels[:, h//2:, :].mean(axis=(1, 2))
+        
+        # Canny runs per face: its suppression and hysteresis would link edges
+        # across faces in a stacked image, and a 48x48 pass is cheap
+        edge_density = np.array([np.count_nonzero(cv2.Canny(face, 50, 150)) for face in faces],
+                                dtype=np.float64) / (h * w)
+        
+        return {
+            'mean_brightness': normalized.mean(axis=(1, 2)),
+            'std_brightness': normalized.std(axis=(1, 2)),
+            'upper_mean': upper_mean,
+            'lower_mean': lower_mean,
+            'contrast': upper_mean - lower_mean,
+            'edge_density': edge_density,
+            'mouth_mean': pixels[:, h*3//4:, w//4:3*w//4].mean(axis=(1, 2)),
+        }
+    
+    def classify_features(self, features):
+        """Map feature arrays to (moods, confidences); rules are checked in order."""
+        f = features
+        rules = [
+            ('happy', 0.75, (f['mean_brightness'] > 0.65) & (f['upper_mean'] > f['lower_mean'])),
+            ('sad', 0.65, (f['mean_brightness'] < 0.4) & (f['std_brightness'] < 0.15)),
+            ('surprise', 0.6, (f['edge_density'] > 0.15) & (f['contrast'] < -20)),
+            ('angry', 0.6, (f['mouth_mean'] < 80) & (f['contrast'] > 30)),
+            ('fear', 0.55, (f['mean_brightness'] < 0.35) & (f['edge_density'] > 0.1)),
+        ]
+        labels = [rule[0] for rule in rules] + ['neutral']
+        conditions = [rule[2] for rule in rules]
+        index = np.select(conditions, np.arange(len(rules)), default=len(rules))
+        confidence = np.select(conditions, [rule[1] for rule in rules], default=0.6)
+        return [labels[i] for i in index], [float(c) for c in confidence]
+
+
+class DnnClassifier:
+    """Small CNN (e.g. a FER2013 model) run on the CPU through cv2.dnn."""
+    
+    name = 'dnn'
+    
+    def __init__(self, model_path=MOOD_MODEL_PATH, size=MOOD_MODEL_SIZE, scale=MOOD_MODEL_SCALE, labels=MOOD_MODEL_LABELS):
+        self.net = cv2.dnn.readNet(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.size = size
+        self.scale = scale
+        self.labels = []
+        for label in labels.split(','):
+            label = MODEL_LABEL_ALIASES.get(label.strip(), label.strip())
+            self.labels.append(label if label in MOOD_LABELS else 'neutral')
+        self.latency = LatencyStats()
+        # Cleared when the model turns out to have a fixed batch size of 1
+        self.batched = True
+        # cv2.dnn.Net is not safe to call from several threads at once
+        self._lock = threading.Lock()
+    
+    def _forward(self, blob):
+        with self._lock:
+            self.net.setInput(blob)
+            return self.net.forward().reshape(len(blob), -1)
+    
+    def predict(self, faces):
+        faces = np.asarray(faces, dtype=np.uint8)
+        if faces.shape[1:] != (self.size, self.size):
+            faces = np.stack([cv2.resize(face, (self.size, self.size)) for face in faces])
+        blob = (faces.astype(np.float32) * self.scale)[:, np.newaxis, :, :]
+        
+        scores = None
+        if self.batched or len(blob) == 1:
+            try:
+                scores = self._forward(blob)
+            except (cv2.error, ValueError) as e:
+                if len(blob) == 1:
+                    raise
+                print(f"Mood model rejected a batch of {len(blob)}, classifying faces one at a time: {e}")
+                self.batched = False
+        if scores is None:
+            scores = np.concatenate([self._forward(blob[i:i + 1]) for i in range(len(blob))])
+        
+        # Apply softmax unless the model already outputs probabilities
+        if not np.allclose(scores.sum(axis=1), 1.0, atol=1e-3) or scores.min() < 0:
+            scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+            scores /= scores.sum(axis=1, keepdims=True)
+        
+        index = scores.argmax(axis=1)
+        moods = [self.labels[i] if i < len(self.labels) else 'neutral' for i in index]
+        return moods, [float(c) for c in scores[np.arange(len(faces)), index]]
+
+
+def load_classifiers(warmup_batch=8):
+    """Load every available backend and warm it up; returns {name: classifier}."""
+    classifiers = {'heuristic': HeuristicClassifier()}
+    if MOOD_MODEL_PATH:
+        try:
+            classifiers['dnn'] = DnnClassifier()
+        except Exception as e:
+            print(f"Could not load mood model {MOOD_MODEL_PATH}: {e}")
+    
+    # The first calls pay for allocation and kernel selection; keep them out of the stats
+    blank = np.full((warmup_batch, 48, 48), 128, dtype=np.uint8)
+    for name, classifier in list(classifiers.items()):
+        try:
+            classifier.predict(blank)
+            start = time.perf_counter()
+            classifier.predict(blank)
+        except Exception as e:
+            if name == 'heuristic':
+                raise
+            # A model that loads but cannot run is dropped; MoodDetector falls back to heuristic
+            print(f"Mood classifier '{name}' failed warm-up, disabling it: {e}")
+            del classifiers[name]
+            continue
+        classifier.latency.warmup_ms = round((time.perf_counter() - start) * 1000, 3)
+    
+    return classifiers
+
 
 # Simple emotion detection using facial landmarks
 class MoodDetector:
-    """Mood detector using OpenCV and facial analysis."""
+    """Mood detector using OpenCV and facial analysis.
+
+    The cascades are stateless and shared; smoothing state lives in a MoodState
+    passed per call so concurrent clients don't mix their frames.
+    """
     
-    def __init__(self):
+    def __init__(self, classifier=MOOD_CLASSIFIER):
         cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
         self.face_cascade = cv2.CascadeClassifier(cascade_path)
         eye_cascade_path = cv2.data.haarcascades + 'haarcascade_eye.xml'
         self.eye_cascade = cv2.CascadeClassifier(eye_cascade_path)
-        self.emotions = ['neutral', 'happy', 'sad', 'angry', 'fear', 'surprise', 'disgust']
-        self.last_mood = 'neutral'
-        self.mood_confidence = 0.5
-        self.mood_history = []
-        self.history_size = 5
-        
-    def detect_face(self, frame):
+        self.emotions = list(MOOD_LABELS)
+        self.classifiers = load_classifiers()
+        if classifier not in self.classifiers:
+            print(f"Mood classifier '{classifier}' unavailable, using heuristic")
+            classifier = 'heuristic'
+        self.classifier = self.classifiers[classifier]
+        
+    def detect_face(self, frame, track=None):
+        """Find faces, following the last face box in track when one is given."""
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
+        
+        if track is not None and track.face_box is not None and track.frames_since_scan < FACE_RESCAN_INTERVAL:
+            track.frames_since_scan += 1
+            faces = self._detect_in_roi(gray, track.face_box)
+            if len(faces) > 0:
+                track.face_box = tuple(int(v) for v in max(faces, key=lambda f: f[2] * f[3]))
+                return faces, gray
+        
+        faces = self._detect_scaled(gray, FACE_DETECT_WIDTH / gray.shape[1])
+        if track is not None:
+            track.frames_since_scan = 0
+            track.face_box = None
+            if len(faces) > 0:
+                track.face_box = tuple(int(v) for v in max(faces, key=lambda f: f[2] * f[3]))
         return faces, gray
     
+    def _detect_scaled(self, gray, scale, min_size=None, max_size=None):
+        """Run the face cascade on gray resized by scale (<= 1); boxes come back in gray coordinates."""
+        if scale < 1:
+            small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        else:
+            scale = 1.0
+            small = gray
+        kwargs = {}
+        if min_size:
+            kwargs['minSize'] = min_size
+        if max_size:
+            kwargs['maxSize'] = max_size
+        faces = self.face_cascade.detectMultiScale(small, 1.3, 5, **kwargs)
+        if len(faces) == 0 or scale == 1.0:
+            return faces
+        return np.round(np.asarray(faces) / scale).astype(int)
+    
+    def _detect_in_roi(self, gray, box):
+        """Search a padded window around the previous face box, at a fixed face scale."""
+        x, y, w, h = box
+        pad = int(max(w, h) * FACE_ROI_PADDING)
+        x0, y0 = max(x - pad, 0), max(y - pad, 0)
+        x1, y1 = min(x + w + pad, gray.shape[1]), min(y + h + pad, gray.shape[0])
+        
+        scale = min(FACE_ROI_WIDTH / w, 1.0)
+        face_px = w * scale
+        # Only look for faces of roughly the tracked size
+        min_side = max(int(face_px * 0.6), 24)
+        max_side = int(face_px * 1.6) + 1
+        faces = self._detect_scaled(gray[y0:y1, x0:x1], scale, (min_side, min_side), (max_side, max_side))
+        if len(faces) == 0:
+            return faces
+        return np.asarray(faces) + np.array([x0, y0, 0, 0])
+    
     def detect_eyes(self, face_region, gray_face):
         eyes = self.eye_cascade.detectMultiScale(gray_face, 1.1, 3)
         return eyes
     
-    def analyze_emotion(self, face_region, gray):
-        if len(face_region.shape) == 3:
-            gray_face = cv2.cvtColor(face_region, cv2.COLOR_BGR2GRAY)
-        else:
-            gray_face = gray
-            
-        resized = cv2.resize(gray_face, (48, 48))
-        normalized = resized / 255.0
-        
-        mean_brightness = np.mean(normalized)
-        std_brightness = np.std(normalized)
-        
-        h, w = gray_face.shape
-        upper_half = gray_face[:h//2, :]
-        lower_half = gray_face[h//2:, :]
-        
-        upper_mean = np.mean(upper_half)
-        lower_mean = np.mean(lower_half)
-        contrast = upper_mean - lower_mean
-        
-        edges = cv2.Canny(gray_face, 50, 150)
-        edge_density = np.sum(edges > 0) / edges.size
-        
-        mouth_region = gray_face[h*3//4:, w//4:3*w//4]
-        mouth_mean = np.mean(mouth_region)
-        
-        mood = 'neutral'
-        confidence = 0.5
-        
-        if mean_brightness > 0.65 and upper_mean > lower_mean:
-            mood = 'happy'
-            confidence = 0.75
-        elif mean_brightness < 0.4 and std_brightness < 0.15:
-            mood = 'sad'
-            confidence = 0.65
-        elif edge_density > 0.15 and contrast < -20:
-            mood = 'surprise'
-            confidence = 0.6
-        elif mouth_mean < 80 and contrast > 30:
-            mood = 'angry'
-            confidence = 0.6
-        elif mean_brightness < 0.35 and edge_density > 0.1:
-            mood = 'fear'
-            confidence = 0.55
-        else:
-            mood = 'neutral'
-            confidence = 0.6
-        
-        self.mood_history.append(mood)
-        if len(self.mood_history) > self.history_size:
-            self.mood_history.pop(0)
-        
-        if len(self.mood_history) >= 3:
-            from collections import Counter
-            mood_counts = Counter(self.mood_history)
-            most_common = mood_counts.most_common(1)[0][0]
-            if mood_counts[most_common] >= 2:
-                mood = most_common
-        
-        self.last_mood = mood
-        self.mood_confidence = confidence
-        
-        return {'mood': mood, 'confidence': confidence}
+    def classify(self, faces):
+        """Classify an (N, 48, 48) face stack with the active backend, timing the call."""
+        start = time.perf_counter()
+        result = self.classifier.predict(faces)
+        self.classifier.latency.record(time.perf_counter() - start, items=len(faces))
+        return result
     
-    def detect_mood(self, frame):
-        faces, gray = self.detect_face(frame)
+    def locate_face(self, frame, track=None):
+        """Find the largest face; returns (coords, 48x48 gray face, eyes found) or None."""
+        faces, gray = self.detect_face(frame, track)
         
         if len(faces) == 0:
-            return {'mood': self.last_mood, 'confidence': 0.3, 'face_detected': False}
+            return None
         
         face = max(faces, key=lambda x: x[2] * x[3])
         x, y, w, h = face
@@ -476,19 +1529,187 @@ class MoodDetector:
         
         eyes = self.detect_eyes(face_region, gray_face)
         
-        emotion_data = self.analyze_emotion(face_region, gray_face)
-        emotion_data['face_detected'] = True
-        emotion_data['face_coords'] = {'x': int(x), 'y': int(y), 'w': int(w), 'h': int(h)}
-        emotion_data['eyes_detected'] = len(eyes) > 0
-        
-        return emotion_data
+        coords = {'x': int(x), 'y': int(y), 'w': int(w), 'h': int(h)}
+        return coords, cv2.resize(gray_face, (48, 48)), len(eyes) > 0
+    
+    def infer(self, frames, tracks):
+        """Unsmoothed per-frame moods, classifying all found faces in one pass.
+        
+        Needs no session state, so it can run in another thread or process;
+        returns (raw results, updated tracks) with None for frames without a face.
+        """
+        raw = [None] * len(frames)
+        located = []
+        for i, (frame, track) in enumerate(zip(frames, tracks)):
+            found = self.locate_face(frame, track)
+            if found is not None:
+                located.append((i, found))
+        
+        if located:
+            stack = np.stack([found[1] for _, found in located])
+            moods, confidences = self.classify(stack)
+            for (i, (coords, _, eyes_detected)), mood, confidence in zip(located, moods, confidences):
+                raw[i] = {
+                    'mood': mood,
+                    'confidence': confidence,
+                    'face_coords': coords,
+                    'eyes_detected': eyes_detected
+                }
+        
+        return raw, tracks
 
 # Initialize mood detector
-mood_detector = MoodDetector()
+# Built on first use (cascades + classifier warm-up); create_app() loads it
+# before forking so workers share it
+mood_detector = LazyGlobal('mood_detector', MoodDetector)
+
+# Mood inference executor: 'inline' runs in the request thread, 'thread' and
+# 'process' hand frames to a pool. At most MOOD_MAX_PENDING inferences are
+# queued or running; beyond that /detect_mood answers 503 instead of queueing.
+# Cooperative servers default to 'thread', which then uses real OS threads so
+# OpenCV work never blocks the event loop
+MOOD_EXECUTOR = os.environ.get('MOOD_EXECUTOR', 'thread' if COOPERATIVE else 'inline')
+MOOD_WORKERS = int(os.environ.get('MOOD_WORKERS', str(os.cpu_count() or 1)))
+MOOD_MAX_PENDING = int(os.environ.get('MOOD_MAX_PENDING', str(MOOD_WORKERS * 4)))
+MOOD_TIMEOUT = float(os.environ.get('MOOD_TIMEOUT', '5'))  # seconds
+
+
+class InferenceBusy(Exception):
+    """Raised when the inference executor is saturated or too slow."""
+
 
-# Create database tables
-with app.app_context():
-    db.create_all()
+_worker_detector = None
+
+def _init_inference_worker():
+    """Process-pool initializer: load the cascades once per worker process."""
+    global _worker_detector
+    _worker_detector = MoodDetector()
+
+def infer_frames(frames, tracks):
+    detector = _worker_detector or mood_detector
+    return detector.infer(frames, tracks)
+
+
+class MoodExecutor:
+    """Runs mood inference inline or on a thread/process pool with bounded backlog."""
+    
+    def __init__(self, mode=MOOD_EXECUTOR, workers=MOOD_WORKERS, max_pending=MOOD_MAX_PENDING, timeout=MOOD_TIMEOUT):
+        if mode not in ('inline', 'thread', 'process'):
+            raise ValueError(f"Unknown MOOD_EXECUTOR: {mode}")
+        if mode == 'inline' and COOPERATIVE:
+            print("Warning: MOOD_EXECUTOR=inline blocks the event loop under gevent; use thread or process")
+        self.mode = mode
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+    
+    def _get_pool(self):
+        # Created on first use so importing the app never forks
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    if self.mode == 'process':
+                        self._pool = ProcessPoolExecutor(self.workers, initializer=_init_inference_worker)
+                    elif COOPERATIVE:
+                        # gevent's pool runs on native threads, outside the event loop
+                        from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+                        self._pool = NativeThreadPoolExecutor(self.workers)
+                    else:
+                        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='mood')
+        return self._pool
+    
+    def run(self, fn, *args):
+        """Call fn(*args) on the executor; raises InferenceBusy when saturated."""
+        if not self._slots.acquire(blocking=False):
+            raise InferenceBusy('Mood inference is busy')
+        
+        if self.mode == 'inline':
+            try:
+                return fn(*args)
+            finally:
+                self._slots.release()
+        
+        try:
+            future = self._get_pool().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise InferenceBusy('Mood inference timed out')
+
+
+mood_executor = MoodExecutor()
+
+def run_mood_inference(frames, states):
+    """Detect moods on the executor, then smooth into each client's state here.
+    
+    Frames that barely differ from the client's previous frame skip detection
+    and get the previous result back with cached: true.
+    """
+    results = [None] * len(frames)
+    thumbnails = [frame_thumbnail(frame, state.track.face_box) for frame, state in zip(frames, states)]
+    pending = []
+    for i, (state, thumbnail) in enumerate(zip(states, thumbnails)):
+        results[i] = cached_mood_result(state, thumbnail)
+        if results[i] is None:
+            pending.append(i)
+    
+    if pending:
+        pending_states = [states[i] for i in pending]
+        tracks = [state.track for state in pending_states]
+        raw, tracks = mood_executor.run(infer_frames, [frames[i] for i in pending], tracks)
+        for i, result in zip(pending, apply_inference(raw, tracks, pending_states)):
+            # Next frame is compared at the face box just found
+            remember_mood_result(states[i], frame_thumbnail(frames[i], states[i].track.face_box), result)
+            results[i] = result
+    
+    return results
+
+# Schema setup (INIT_DB=1) runs once per deployment: in create_app() before
+# gunicorn forks, or on the first request under `python app.py` and `flask run`.
+# With INIT_DB=0 the schema is managed separately (flask --app app init-db).
+INIT_DB = os.environ.get('INIT_DB', '1') == '1'
+
+_db_init_pending = INIT_DB
+_db_init_lock = threading.Lock()
+
+def init_db():
+    """Create tables, add new columns and migrate legacy playlists; safe to re-run."""
+    global _db_init_pending
+    started = time.perf_counter()
+    with app.app_context():
+        db.create_all()
+        add_missing_columns()
+        migrate_playlist_blobs()
+    _db_init_pending = False
+    startup_timer.lazy['db_init'] = time.perf_counter() - started
+
+@app.before_request
+def init_db_on_first_request():
+    """Set up the schema before the first request when no entry point did (dev servers)."""
+    if not _db_init_pending:
+        return
+    with _db_init_lock:
+        if _db_init_pending:
+            init_db()
+
+startup_timer.mark('models')
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create or update the database schema."""
+    init_db()
+    print("Database ready")
+
+@app.cli.command('migrate-playlists')
+def migrate_playlists_command():
+    """Move legacy playlist JSON blobs into playlist_item rows."""
+    print(f"Migrated {migrate_playlist_blobs()} playlists")
 
 # Routes
 @app.route('/')
@@ -559,8 +1780,10 @@ def save_api_key():
     data = request.get_json()
     api_key = data.get('api_key', '')
     
-    current_user.youtube_api_key = api_key
+    user = current_user_record()
+    user.youtube_api_key = api_key
     db.session.commit()
+    invalidate_user(user.id)
     
     return jsonify({'success': True, 'message': 'API key saved successfully'})
 
@@ -580,14 +1803,128 @@ def save_settings():
     """Save user's preferences."""
     data = request.get_json()
     
-    current_user.music_service = data.get('music_service', 'youtube')
-    current_user.preferred_mood = data.get('preferred_mood', 'neutral')
+    preference_buffer.set(current_user.id, 'music_service', data.get('music_service', 'youtube'))
+    preference_buffer.set(current_user.id, 'preferred_mood', data.get('preferred_mood', 'neutral'))
     
-    db.session.commit()
+    # An explicit save is written through right away
+    preference_buffer.flush()
     
     return jsonify({'success': True})
 
 # Spotify OAuth routes
+# Spotify access tokens last an hour. A user's token is refreshed in the
+# background once it is within SPOTIFY_REFRESH_MARGIN of expiry, or inline if it
+# has already expired; concurrent refreshes for one user share a single call.
+# Searches without a user token use the app's client-credentials token. A token
+# request that fails is not retried for SPOTIFY_TOKEN_BACKOFF seconds.
+SPOTIFY_REFRESH_MARGIN = int(os.environ.get('SPOTIFY_REFRESH_MARGIN', '300'))  # seconds
+SPOTIFY_TOKEN_BACKOFF = int(os.environ.get('SPOTIFY_TOKEN_BACKOFF', '60'))  # seconds
+
+
+class SpotifyTokenManager:
+    """Keeps user access tokens fresh and holds the shared client-credentials token."""
+    
+    def __init__(self, margin=SPOTIFY_REFRESH_MARGIN, backoff=SPOTIFY_TOKEN_BACKOFF):
+        self.margin = margin
+        self._flights = SingleFlight()
+        self._failed = TTLCache(10000, backoff)  # ('user', id) or 'app' -> True
+        self._pool = ThreadPoolExecutor(2, thread_name_prefix='spotify-refresh')
+        self._app_token = (None, 0.0)
+        self.refreshes = 0
+        self.refresh_failures = 0
+    
+    def user_token(self, user):
+        """A usable access token for a user snapshot, or None."""
+        if not user.is_authenticated or not user.spotify_token:
+            return None
+        expires_at = user.spotify_token_expires_at
+        now = time.time()
+        if expires_at is None or now < expires_at - self.margin:
+            return user.spotify_token
+        if now < expires_at:
+            # Still valid: refresh ahead of time without holding up this request
+            self._pool.submit(self.refresh, user.id)
+            return user.spotify_token
+        return self.refresh(user.id)
+    
+    def refresh(self, user_id):
+        """Refresh a user's token; concurrent callers share one refresh. Returns the new token or None."""
+        if self._failed.get(('user', user_id)):
+            return None
+        return self._flights.run(('user', user_id), self._refresh, user_id)
+    
+    def _refresh(self, user_id):
+        with app.app_context():
+            user = db.session.get(User, user_id)
+            if user is None or not user.spotify_refresh_token:
+                return None
+            # Another worker may have refreshed it already
+            if user.spotify_token_expires_at and time.time() < user.spotify_token_expires_at - self.margin:
+                invalidate_user(user_id)
+                return user.spotify_token
+            
+            tokens = self._request_token({'grant_type': 'refresh_token', 'refresh_token': user.spotify_refresh_token})
+            if tokens is None:
+                self.refresh_failures += 1
+                self._failed.set(('user', user_id), True)
+                return None
+            user.spotify_token = tokens['access_token']
+            # Spotify may rotate the refresh token
+            user.spotify_refresh_token = tokens.get('refresh_token', user.spotify_refresh_token)
+            user.spotify_token_expires_at = time.time() + tokens.get('expires_in', 3600)
+            db.session.commit()
+            self.refreshes += 1
+            token = user.spotify_token
+        invalidate_user(user_id)
+        return token
+    
+    def app_token(self):
+        """Client-credentials token for catalog searches, shared by all requests; None if not configured."""
+        if not (SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET):
+            return None
+        token, expires_at = self._app_token
+        if token and time.time() < expires_at - self.margin:
+            return token
+        if self._failed.get('app'):
+            return None
+        return self._flights.run('app', self._fetch_app_token)
+    
+    def _fetch_app_token(self):
+        token, expires_at = self._app_token
+        if token and time.time() < expires_at - self.margin:
+            return token
+        tokens = self._request_token({'grant_type': 'client_credentials'})
+        if tokens is None:
+            self._failed.set('app', True)
+            return None
+        self._app_token = (tokens['access_token'], time.time() + tokens.get('expires_in', 3600))
+        return tokens['access_token']
+    
+    def _request_token(self, data):
+        try:
+            response = http_client.post(SPOTIFY_TOKEN_URL, data=data, auth=(SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET))
+        except requests.RequestException as e:
+            print(f"Spotify token request failed: {e}")
+            return None
+        if response.status_code != 200:
+            print(f"Spotify token request failed: {response.status_code}")
+            return None
+        return response.json()
+    
+    def connected(self, user_id):
+        """The user just stored new tokens; forget any earlier refresh failure."""
+        self._failed.pop(('user', user_id))
+    
+    def token_for(self, user):
+        """The user's token if connected, else the app token: (token, user_id or None)."""
+        token = self.user_token(user)
+        if token:
+            return token, user.id
+        return self.app_token(), None
+
+
+spotify_tokens = SpotifyTokenManager()
+
 @app.route('/spotify_login')
 @login_required
 def spotify_login():
@@ -624,16 +1961,23 @@ def spotify_callback():
         'client_secret': SPOTIFY_CLIENT_SECRET
     }
     
-    response = requests.post(SPOTIFY_TOKEN_URL, data=token_data)
+    try:
+        response = http_client.post(SPOTIFY_TOKEN_URL, data=token_data)
+    except requests.RequestException as e:
+        return render_template('index.html', error=f'Spotify token exchange failed: {e}')
     
     if response.status_code != 200:
         return render_template('index.html', error=f'Spotify token exchange failed: {response.status_code}')
     
     tokens = response.json()
-    current_user.spotify_token = tokens.get('access_token')
-    current_user.spotify_refresh_token = tokens.get('refresh_token')
-    current_user.music_service = 'spotify'
+    user = current_user_record()
+    user.spotify_token = tokens.get('access_token')
+    user.spotify_refresh_token = tokens.get('refresh_token')
+    user.spotify_token_expires_at = time.time() + tokens.get('expires_in', 3600)
     db.session.commit()
+    invalidate_user(user.id)
+    spotify_tokens.connected(user.id)
+    preference_buffer.set(user.id, 'music_service', 'spotify')
     
     return redirect(url_for('index'))
 
@@ -648,7 +1992,6 @@ def google_login():
     scope = 'openid email profile https://www.googleapis.com/auth/youtube.readonly https://www.googleapis.com/auth/youtube.force-ssl'
     
     # Generate state for security
-    import secrets
     state = secrets.token_urlsafe(32)
     session['oauth_state'] = state
     
@@ -682,7 +2025,10 @@ def google_callback():
         'redirect_uri': GOOGLE_REDIRECT_URI
     }
     
-    response = requests.post(GOOGLE_TOKEN_URL, data=token_data)
+    try:
+        response = http_client.post(GOOGLE_TOKEN_URL, data=token_data)
+    except requests.RequestException as e:
+        return render_template('index.html', error=f'Google token exchange failed: {e}')
     
     if response.status_code != 200:
         return render_template('index.html', error=f'Google token exchange failed: {response.status_code}')
@@ -691,10 +2037,13 @@ def google_callback():
     access_token = tokens.get('access_token')
     
     # Get user info
-    userinfo_response = requests.get(
-        GOOGLE_USERINFO_URL,
-        headers={'Authorization': f'Bearer {access_token}'}
-    )
+    try:
+        userinfo_response = http_client.get(
+            GOOGLE_USERINFO_URL,
+            headers={'Authorization': f'Bearer {access_token}'}
+        )
+    except requests.RequestException:
+        return render_template('index.html', error='Failed to get user info')
     
     if userinfo_response.status_code != 200:
         return render_template('index.html', error='Failed to get user info')
@@ -725,75 +2074,273 @@ def google_callback():
             db.session.add(user)
     
     db.session.commit()
+    invalidate_user(user.id)
     
-    # Fetch user's YouTube interests
-    fetch_youtube_interests(user, access_token)
+    # Fetch user's YouTube interests in the background
+    interest_jobs.submit(user.id, access_token)
     
     login_user(user)
     return redirect(url_for('index'))
 
-def fetch_youtube_interests(user, access_token):
-    """Fetch user's YouTube subscriptions and liked videos to determine interests."""
+# Interest extraction runs as a background job so the OAuth callback can
+# redirect straight away; the three YouTube sources within a job are read concurrently.
+INTEREST_JOB_WORKERS = int(os.environ.get('INTEREST_JOB_WORKERS', '4'))
+INTEREST_JOB_RETRIES = int(os.environ.get('INTEREST_JOB_RETRIES', '2'))
+INTEREST_RETRY_DELAY = float(os.environ.get('INTEREST_RETRY_DELAY', '2'))  # seconds, doubled per retry
+INTEREST_JOB_TIMEOUT = 600  # seconds after which a job still 'pending' is taken as lost (its worker died)
+
+INTEREST_COMMON_WORDS = {'the', 'and', 'for', 'with', 'from', 'your', 'this', 'that', 'video', 'music', 'song', 'official', 'lyric', 'lyrics', 'video', 'hd', 'full', 'new', 'best', 'top', 'mix', '2024', '2025', '2026'}
+
+
+class TransientFetchError(Exception):
+    """A YouTube read failed in a way worth retrying (network, 429, 5xx)."""
+
+
+# Profiles are synced incrementally: each source walks at most INTEREST_MAX_PAGES
+# pages per sync (the rest resumes from a saved pageToken) and skips items it has
+# already counted. Term weights halve every INTEREST_HALF_LIFE_DAYS.
+INTEREST_MAX_PAGES = int(os.environ.get('INTEREST_MAX_PAGES', '10'))  # per source per sync
+INTEREST_PROFILE_TERMS = int(os.environ.get('INTEREST_PROFILE_TERMS', '200'))  # terms kept per user
+INTEREST_SEEN_MAX = int(os.environ.get('INTEREST_SEEN_MAX', '5000'))  # item ids remembered per source
+INTEREST_HALF_LIFE = float(os.environ.get('INTEREST_HALF_LIFE_DAYS', '30')) * 86400  # seconds
+INTEREST_TOP_TERMS = 20  # stored in User.user_interests for search
+
+def fetch_youtube_page(url, headers, etag=None):
+    """GET one page of a YouTube list endpoint.
+    
+    Returns the JSON body, or None if unchanged since etag (304) or access is refused.
+    """
+    if etag:
+        headers = dict(headers, **{'If-None-Match': etag})
     try:
-        headers = {'Authorization': f'Bearer {access_token}'}
-        interests = []
-        
-        # Get user subscriptions (channels they follow)
-        subs_url = f"https://www.googleapis.com/youtube/v3/subscriptions?part=snippet&mine=true&maxResults=50"
-        subs_response = requests.get(subs_url, headers=headers)
-        
-        if subs_response.status_code == 200:
-            subs_data = subs_response.json()
-            for item in subs_data.get('items', []):
-                channel_title = item['snippet']['title']
-                # Extract keywords from channel names
-                words = channel_title.lower().split()
-                interests.extend([w for w in words if len(w) > 2])
-        
-        # Get user's liked videos
-        likes_url = "https://www.googleapis.com/youtube/v3/videos?part=snippet&myRating=like&maxResults=50"
-        likes_response = requests.get(likes_url, headers=headers)
-        
-        if likes_response.status_code == 200:
-            likes_data = likes_response.json()
-            for item in likes_data.get('items', []):
-                title = item['snippet']['title']
-                tags = item['snippet'].get('tags', [])
-                # Extract keywords from title
-                words = title.lower().replace('-', ' ').replace('|', ' ').split()
-                interests.extend([w for w in words if len(w) > 2])
-                interests.extend([t.lower() for t in tags])
-        
-        # Get user's playlist (watch history)
-        playlist_url = "https://www.googleapis.com/youtube/v3/playlists?part=snippet&mine=true&maxResults=20"
-        playlist_response = requests.get(playlist_url, headers=headers)
-        
-        if playlist_response.status_code == 200:
-            playlist_data = playlist_response.json()
-            for item in playlist_data.get('items', []):
-                playlist_title = item['snippet']['title']
-                words = playlist_title.lower().split()
-                interests.extend([w for w in words if len(w) > 2])
-        
-        # Count and get most common interests
-        from collections import Counter
-        interest_counts = Counter(interests)
-        
-        # Filter out common words
-        common_words = {'the', 'and', 'for', 'with', 'from', 'your', 'this', 'that', 'video', 'music', 'song', 'official', 'lyric', 'lyrics', 'video', 'hd', 'full', 'new', 'best', 'top', 'mix', '2024', '2025', '2026'}
-        filtered_interests = {k: v for k, v in interest_counts.items() if k not in common_words}
-        
-        # Get top interests
-        top_interests = sorted(filtered_interests.items(), key=lambda x: x[1], reverse=True)[:20]
-        user_interests = json.dumps([item[0] for item in top_interests])
-        
-        user.user_interests = user_interests
+        response = http_client.get(url, headers=headers)
+    except requests.RequestException as e:
+        raise TransientFetchError(str(e))
+    if response.status_code == 429 or response.status_code >= 500:
+        raise TransientFetchError(f"{url} returned {response.status_code}")
+    if response.status_code != 200:
+        return None
+    return response.json()
+
+def subscription_words(item):
+    # Extract keywords from channel names
+    return [w for w in item['snippet']['title'].lower().split() if len(w) > 2]
+
+def liked_video_words(item):
+    title = item['snippet']['title']
+    tags = item['snippet'].get('tags', [])
+    # Extract keywords from title
+    words = title.lower().replace('-', ' ').replace('|', ' ').split()
+    return [w for w in words if len(w) > 2] + [t.lower() for t in tags]
+
+def playlist_words(item):
+    return [w for w in item['snippet']['title'].lower().split() if len(w) > 2]
+
+INTEREST_SOURCES = (
+    # (checkpoint name, list url, keyword extractor, newest items first)
+    # User subscriptions (channels they follow)
+    ('subscriptions', f"{YOUTUBE_API_URL}/subscriptions?part=snippet&mine=true&maxResults=50", subscription_words, False),
+    # User's liked videos
+    ('likes', f"{YOUTUBE_API_URL}/videos?part=snippet&myRating=like&maxResults=50", liked_video_words, True),
+    # User's playlists
+    ('playlists', f"{YOUTUBE_API_URL}/playlists?part=snippet&mine=true&maxResults=50", playlist_words, False),
+)
+
+def sync_interest_source(url, extract, newest_first, headers, checkpoint):
+    """Read the pages of one YouTube list that changed since checkpoint.
+    
+    Returns (Counter of items per term among unseen items, updated checkpoint).
+    """
+    seen = checkpoint.get('seen', [])
+    seen_keys = set(seen)
+    etag = checkpoint.get('etag') if newest_first else None
+    page_token = checkpoint.get('page_token')
+    counts = Counter()
+    new_keys = []
+    
+    for _ in range(INTEREST_MAX_PAGES):
+        page_url = f"{url}&pageToken={page_token}" if page_token else url
+        # Only the first page of a fresh walk over a newest-first list is
+        # conditional: there a 304 means nothing was added. Other lists are
+        # unordered, so new items can land on any page and are walked in full.
+        conditional = newest_first and not page_token
+        data = fetch_youtube_page(page_url, headers, etag=etag if conditional else None)
+        if data is None:
+            break
+        if conditional:
+            etag = data.get('etag')
+        
+        caught_up = False
+        for item in data.get('items', []):
+            key = zlib.crc32(str(item['id']).encode())
+            if key in seen_keys:
+                if newest_first:
+                    caught_up = True
+                    break
+                continue
+            seen_keys.add(key)
+            new_keys.append(key)
+            counts.update({word[:100] for word in extract(item)})
+        
+        page_token = None if caught_up else data.get('nextPageToken')
+        if not page_token:
+            break
+    
+    seen = (seen + new_keys)[-INTEREST_SEEN_MAX:]
+    return counts, {'etag': etag, 'page_token': page_token, 'seen': seen}
+
+def decay_interest_weights(weights, counts, synced_at, now):
+    """Decay old term weights by elapsed time and add sublinear TF for new items."""
+    decay = 0.5 ** (max(now - synced_at, 0) / INTEREST_HALF_LIFE) if synced_at else 1.0
+    weights = {term: weight * decay for term, weight in weights.items()}
+    for term, count in counts.items():
+        if term not in INTEREST_COMMON_WORDS:
+            weights[term] = weights.get(term, 0.0) + 1 + math.log(count)
+    top = sorted(weights.items(), key=lambda x: x[1], reverse=True)[:INTEREST_PROFILE_TERMS]
+    return {term: round(weight, 4) for term, weight in top if weight >= 0.01}
+
+def update_term_profiles(added, removed):
+    """Adjust how many profiles contain each term; the caller commits."""
+    if removed:
+        db.session.execute(db.update(InterestTerm).where(InterestTerm.term.in_(list(removed)))
+                           .values(profiles=InterestTerm.profiles - 1))
+    if not added:
+        return
+    existing = {row[0] for row in db.session.query(InterestTerm.term).filter(InterestTerm.term.in_(list(added))).all()}
+    if existing:
+        db.session.execute(db.update(InterestTerm).where(InterestTerm.term.in_(list(existing)))
+                           .values(profiles=InterestTerm.profiles + 1))
+    for term in added - existing:
+        try:
+            with db.session.begin_nested():
+                db.session.add(InterestTerm(term=term, profiles=1))
+        except IntegrityError:
+            # Another profile added the term first
+            db.session.execute(db.update(InterestTerm).where(InterestTerm.term == term)
+                               .values(profiles=InterestTerm.profiles + 1))
+
+def rank_interests(weights, limit=INTEREST_TOP_TERMS):
+    """Top terms by weight x IDF across all profiles, so words everyone has rank lower."""
+    if not weights:
+        return []
+    total = db.session.query(db.func.count(InterestProfile.user_id)).scalar() or 0
+    profiles = dict(db.session.query(InterestTerm.term, InterestTerm.profiles)
+                    .filter(InterestTerm.term.in_(list(weights))).all())
+    scores = {term: weight * (math.log((1 + total) / (1 + profiles.get(term, 0))) + 1)
+              for term, weight in weights.items()}
+    return [term for term, _ in sorted(scores.items(), key=lambda x: x[1], reverse=True)[:limit]]
+
+def fetch_youtube_interests(user_id, access_token):
+    """Sync the user's interest profile from their YouTube subscriptions, liked videos and playlists.
+    
+    Only pages changed since the last sync are read. Raises TransientFetchError
+    when a read should be retried.
+    """
+    with app.app_context():
+        profile = db.session.get(InterestProfile, user_id)
+        checkpoints = json.loads(profile.checkpoints) if profile and profile.checkpoints else {}
+        old_weights = json.loads(profile.weights) if profile and profile.weights else {}
+        synced_at = profile.synced_at if profile else None
+    
+    headers = {'Authorization': f'Bearer {access_token}'}
+    futures = [
+        interest_jobs.fetch_pool.submit(sync_interest_source, url, extract, newest_first, headers, checkpoints.get(name, {}))
+        for name, url, extract, newest_first in INTEREST_SOURCES
+    ]
+    counts = Counter()
+    for future, (name, _, _, _) in zip(futures, INTEREST_SOURCES):
+        source_counts, checkpoints[name] = future.result()
+        counts.update(source_counts)
+    
+    now = time.time()
+    weights = decay_interest_weights(old_weights, counts, synced_at, now)
+    
+    with app.app_context():
+        profile = db.session.get(InterestProfile, user_id) or InterestProfile(user_id=user_id)
+        profile.weights = json.dumps(weights)
+        profile.checkpoints = json.dumps(checkpoints)
+        profile.synced_at = now
+        db.session.add(profile)
+        update_term_profiles(set(weights) - set(old_weights), set(old_weights) - set(weights))
+        db.session.flush()
+        user_interests = json.dumps(rank_interests(weights))
+        db.session.execute(db.update(User).where(User.id == user_id).values(user_interests=user_interests))
         db.session.commit()
-        
-        print(f"User interests fetched: {user_interests}")
-        
-    except Exception as e:
-        print(f"Error fetching YouTube interests: {e}")
+    invalidate_user(user_id)
+    
+    print(f"User interests synced ({sum(counts.values())} new term hits): {user_interests}")
+
+
+class InterestJobs:
+    """In-process job queue for interest syncs, with retries and per-user status.
+    
+    Status is 'pending', 'ready' or 'failed'. It is stored on InterestProfile so
+    that any worker process can answer a status poll.
+    """
+    
+    def __init__(self, workers=INTEREST_JOB_WORKERS, retries=INTEREST_JOB_RETRIES, retry_delay=INTEREST_RETRY_DELAY):
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix='interest-job')
+        self.fetch_pool = ThreadPoolExecutor(workers * 3, thread_name_prefix='interest-fetch')
+    
+    def submit(self, user_id, access_token):
+        now = time.time()
+        with app.app_context():
+            try:
+                with db.session.begin_nested():
+                    if db.session.get(InterestProfile, user_id) is None:
+                        db.session.add(InterestProfile(user_id=user_id))
+            except IntegrityError:
+                # Another worker created it first
+                pass
+            # Claim the job unless one is already pending in any process
+            claimed = db.session.execute(
+                db.update(InterestProfile)
+                .where(InterestProfile.user_id == user_id)
+                .where(db.or_(InterestProfile.sync_status.is_(None),
+                              InterestProfile.sync_status != 'pending',
+                              InterestProfile.sync_started_at < now - INTEREST_JOB_TIMEOUT))
+                .values(sync_status='pending', sync_started_at=now)
+            ).rowcount
+            db.session.commit()
+        if claimed:
+            self.pool.submit(self._run, user_id, access_token)
+    
+    def status(self, user_id):
+        """{'status': ...} for the user's latest job, or None if none was queued."""
+        profile = db.session.get(InterestProfile, user_id)
+        if profile is None or profile.sync_status is None:
+            return None
+        if profile.sync_status == 'pending' and (profile.sync_started_at or 0) < time.time() - INTEREST_JOB_TIMEOUT:
+            return {'status': 'failed'}
+        return {'status': profile.sync_status}
+    
+    def _set_status(self, user_id, status):
+        with app.app_context():
+            db.session.execute(db.update(InterestProfile).where(InterestProfile.user_id == user_id)
+                               .values(sync_status=status))
+            db.session.commit()
+    
+    def _run(self, user_id, access_token):
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                fetch_youtube_interests(user_id, access_token)
+                self._set_status(user_id, 'ready')
+                return
+            except TransientFetchError as e:
+                print(f"Interest sync for user {user_id} failed (attempt {attempt + 1}): {e}")
+                if attempt < self.retries:
+                    time.sleep(delay)
+                    delay *= 2
+            except Exception as e:
+                print(f"Error fetching YouTube interests: {e}")
+                break
+        self._set_status(user_id, 'failed')
+
+
+interest_jobs = InterestJobs()
 
 @app.route('/get_user_interests')
 @login_required
@@ -802,112 +2349,491 @@ def get_user_interests():
     if not current_user.google_id:
         return jsonify({'error': 'Not connected to Google/YouTube', 'interests': []})
     
-    if current_user.user_interests:
+    job = interest_jobs.status(current_user.id)
+    status = job['status'] if job else None
+    
+    if status == 'pending':
+        return jsonify({'interests': [], 'status': 'pending', 'message': 'Fetching your YouTube interests...'})
+    
+    # Read after the status: a job that reported ready has already written these.
+    # The cached user snapshot may predate the sync or come from another worker.
+    user_interests = db.session.query(User.user_interests).filter(User.id == current_user.id).scalar()
+    if user_interests:
         try:
-            interests = json.loads(current_user.user_interests)
-            return jsonify({'interests': interests})
+            interests = json.loads(user_interests)
+            return jsonify({'interests': interests, 'status': 'ready'})
         except:
             pass
     
-    return jsonify({'interests': [], 'message': 'No interests found. Login with Google to fetch your YouTube interests.'})
+    return jsonify({'interests': [], 'status': status or 'none', 'message': 'No interests found. Login with Google to fetch your YouTube interests.'})
 
 @app.route('/search_based_on_interests', methods=['POST'])
 def search_based_on_interests():
     """Search YouTube videos based on user's interests."""
-    import random
-    
     try:
         data = request.get_json()
         mood = data.get('mood', 'neutral')
         shuffle = data.get('shuffle', False)
         
+        # Fan-out mode runs the interests search alongside the other sources
+        if data.get('fanout', SEARCH_FANOUT):
+            return search_fanout(mood, shuffle)
+        
         # Get API key
-        api_key = YOUTUBE_API_KEY
-        if current_user.is_authenticated and current_user.youtube_api_key:
-            api_key = current_user.youtube_api_key
+        api_key = youtube_api_key_for(current_user)
         
         # Check if user has Google/YouTube connection and interests
-        if current_user.is_authenticated and current_user.google_id and current_user.user_interests:
-            try:
-                interests = json.loads(current_user.user_interests)
-                if interests:
-                    # Generate search query from interests
-                    interest_query = ' '.join(interests[:5])
-                    
-                    # Combine with mood
-                    mood_query = MOOD_QUERY_VARIATIONS.get(mood, MOOD_QUERY_VARIATIONS['neutral'])[0]
-                    
-                    # Create hybrid query
-                    combined_query = f"{interest_query} {mood_query}"
-                    
-                    # Search with combined query
-                    if api_key and api_key != 'YOUR_YOUTUBE_API_KEY_HERE':
-                        params = {
-                            'part': 'snippet',
-                            'q': combined_query,
-                            'type': 'video',
-                            'videoCategoryId': '10',
-                            'maxResults': 15,
-                            'key': api_key,
-                            'order': 'relevance'
-                        }
-                        
-                        response = requests.get(YOUTUBE_SEARCH_URL, params=params)
-                        
-                        if response.status_code == 200:
-                            results = response.json()
-                            videos = []
-                            for item in results.get('items', []):
-                                video_id = item['id']['videoId']
-                                snippet = item['snippet']
-                                videos.append({
-                                    'id': video_id,
-                                    'title': snippet['title'],
-                                    'channel': snippet['channelTitle'],
-                                    'thumbnail': snippet['thumbnails']['high']['url'] if 'high' in snippet['thumbnails'] else snippet['thumbnails']['default']['url'],
-                                    'youtube_url': f'https://www.youtube.com/watch?v={video_id}',
-                                    'embed_url': f'https://www.youtube.com/embed/{video_id}',
-                                    'type': 'youtube'
-                                })
-                            
-                            if shuffle:
-                                random.shuffle(videos)
-                            
-                            return jsonify({'videos': videos, 'mood': mood, 'mode': 'interests'})
-            except Exception as e:
-                print(f"Error using interests: {e}")
+        combined_query = interest_query_for(current_user, mood)
+        if not (api_key and combined_query):
+            return search_youtube(mood, shuffle)
         
-        # Fallback to regular search
-        return search_youtube(mood, shuffle)
+        try:
+            videos = youtube_interest_videos(combined_query, api_key)
+        except Exception as e:
+            print(f"Error using interests: {e}")
+            videos = None
+        
+        if videos is None:
+            # Fallback to regular search
+            return search_youtube(mood, shuffle)
+        
+        if shuffle:
+            random.shuffle(videos)
+        
+        return jsonify({'videos': videos, 'mood': mood, 'mode': 'interests'})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # API Routes
+MOOD_BATCH_MAX = int(os.environ.get('MOOD_BATCH_MAX', '32'))
+MAX_FRAME_BYTES = int(os.environ.get('MAX_FRAME_BYTES', str(4 * 1024 * 1024)))  # per-request body cap
+RAW_FRAME_TYPES = ('application/octet-stream', 'image/jpeg', 'image/webp', 'image/png')
+
+
+class FrameTooLarge(Exception):
+    """A chunked frame upload ran past MAX_FRAME_BYTES."""
+
+
+def decode_image(image_data):
+    """Decode a base64 (optionally data-URL) image into a BGR frame, or None."""
+    if 'base64,' in image_data:
+        image_data = image_data.split('base64,')[1]
+    
+    img_bytes = base64.b64decode(image_data)
+    nparr = np.frombuffer(img_bytes, np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+def read_stream_array(stream, length):
+    """Read up to length bytes from a stream straight into a uint8 array."""
+    buf = np.empty(length, dtype=np.uint8)
+    view = memoryview(buf)
+    filled = 0
+    while filled < length:
+        n = stream.readinto(view[filled:])
+        if not n:
+            break
+        filled += n
+    return buf[:filled]
+
+def read_body_array(limit=MAX_FRAME_BYTES):
+    """The raw request body as a uint8 array.
+    
+    A chunked body (no Content-Length) is read up to limit bytes; FrameTooLarge
+    if it runs past that.
+    """
+    if request.content_length is not None:
+        return read_stream_array(request.stream, request.content_length)
+    chunks = []
+    size = 0
+    while size <= limit:
+        chunk = request.stream.read(min(64 * 1024, limit + 1 - size))
+        if not chunk:
+            return np.frombuffer(b''.join(chunks), np.uint8)
+        chunks.append(chunk)
+        size += len(chunk)
+    raise FrameTooLarge(f"Frame larger than {limit} bytes")
+
+def length_required():
+    """A raw body with no Content-Length that the server does not delimit (not chunked)."""
+    return (request.mimetype in RAW_FRAME_TYPES and request.content_length is None
+            and not request.environ.get('wsgi.input_terminated'))
+
+class FrameRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Werkzeug spools file parts to a SpooledTemporaryFile; keep requests up to
+        # one frame's size in a BytesIO instead, so upload_array can wrap its buffer
+        if total_content_length is not None and total_content_length <= MAX_FRAME_BYTES:
+            return io.BytesIO()
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+
+app.request_class = FrameRequest
+
+def upload_array(upload):
+    """Expose a multipart file upload as a uint8 array, without copying when in memory."""
+    stream = upload.stream
+    if isinstance(stream, io.BytesIO):
+        return np.frombuffer(stream.getbuffer(), np.uint8)
+    return np.frombuffer(stream.read(), np.uint8)
+
+def decode_array(nparr):
+    if nparr.size == 0:
+        return None
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+def binary_client_id():
+    return request.args.get('client_id') or request.headers.get('X-Client-Id')
+
+def read_request_frames(multipart_field):
+    """Decode frames from a raw-body or multipart request.
+    
+    Returns (frames, data) where data carries the client_id; a frame that fails
+    to decode is None.
+    """
+    if request.mimetype in RAW_FRAME_TYPES:
+        frame = decode_array(read_body_array())
+        return [frame], {'client_id': binary_client_id()}
+    
+    uploads = request.files.getlist(multipart_field)
+    frames = [decode_array(upload_array(upload)) for upload in uploads]
+    return frames, {'client_id': request.form.get('client_id') or binary_client_id()}
+
+def is_binary_upload():
+    return request.mimetype in RAW_FRAME_TYPES or request.mimetype == 'multipart/form-data'
+
 @app.route('/detect_mood', methods=['POST'])
 def detect_mood():
-    """Detect mood from base64 encoded image."""
+    """Detect mood from a base64 JSON image, a raw image body or a multipart upload."""
+    if request.content_length and request.content_length > MAX_FRAME_BYTES:
+        return jsonify({'error': 'Frame too large'}), 413
+    if length_required():
+        return jsonify({'error': 'Content-Length required'}), 411
+    
     try:
-        data = request.get_json()
-        image_data = data.get('image', '')
-        
-        if 'base64,' in image_data:
-            image_data = image_data.split('base64,')[1]
-        
-        img_bytes = base64.b64decode(image_data)
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        if is_binary_upload():
+            frames, data = read_request_frames('image')
+            frame = frames[0] if frames else None
+        else:
+            data = request.get_json()
+            frame = decode_image(data.get('image', ''))
         
         if frame is None:
             return jsonify({'error': 'Could not decode image'}), 400
         
-        mood_data = mood_detector.detect_mood(frame)
+        state = mood_states.get(get_mood_session_key(data))
+        mood_data = run_mood_inference([frame], [state])[0]
         
         return jsonify(mood_data)
         
+    except FrameTooLarge:
+        return jsonify({'error': 'Frame too large'}), 413
+    except InferenceBusy as e:
+        return jsonify({'error': 'busy', 'message': str(e)}), 503, {'Retry-After': '1'}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/detect_mood_batch', methods=['POST'])
+def detect_mood_batch():
+    """Detect moods for several frames in one request.
+    
+    JSON body: {"frames": [{"image": ..., "client_id": ...}, ...]}; frames without
+    a client_id use the caller's session state, in order. Multipart bodies send
+    each frame as a "frames" file part with an optional client_id form field.
+    """
+    if request.content_length and request.content_length > MAX_FRAME_BYTES * MOOD_BATCH_MAX:
+        return jsonify({'error': 'Request too large'}), 413
+    
+    try:
+        if request.mimetype == 'multipart/form-data':
+            decoded, data = read_request_frames('frames')
+            items = [data] * len(decoded)
+        else:
+            items = request.get_json().get('frames', [])
+            decoded = None
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'No frames provided'}), 400
+        if len(items) > MOOD_BATCH_MAX:
+            return jsonify({'error': f'Too many frames (max {MOOD_BATCH_MAX})'}), 400
+        
+        results = [None] * len(items)
+        frames, states, slots = [], [], []
+        for i, item in enumerate(items):
+            if decoded is not None:
+                frame = decoded[i]
+            else:
+                if isinstance(item, str):
+                    item = {'image': item}
+                try:
+                    frame = decode_image(item.get('image', ''))
+                except Exception:
+                    frame = None
+            if frame is None:
+                results[i] = {'error': 'Could not decode image'}
+                continue
+            frames.append(frame)
+            states.append(mood_states.get(get_mood_session_key(item)))
+            slots.append(i)
+        
+        if frames:
+            for i, mood_data in zip(slots, run_mood_inference(frames, states)):
+                results[i] = mood_data
+        
+        return jsonify({'results': results})
+        
+    except InferenceBusy as e:
+        return jsonify({'error': 'busy', 'message': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Streaming mood detection. Clients push JPEG frames (POST /mood_stream/frame,
+# or binary messages on /mood_ws) and receive an event only when the smoothed
+# mood changes (SSE on GET /mood_stream, or text messages on /mood_ws). Each
+# stream holds one undecoded frame: a push that arrives while inference is busy
+# replaces the waiting frame, so latency stays at one inference, not a queue.
+# Every open stream holds a serving thread; use async_server.py for many.
+MOOD_STREAM_KEEPALIVE = float(os.environ.get('MOOD_STREAM_KEEPALIVE', '15'))  # seconds between SSE keepalives
+
+
+class MoodStream:
+    """Latest-frame slot for one streaming client."""
+    
+    def __init__(self):
+        self._frame = None
+        self._cond = threading.Condition()
+        self.closed = False
+        self.last_mood = None
+        self.last_active = time.monotonic()
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+    
+    def push(self, data):
+        with self._cond:
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = data
+            self.received += 1
+            self.last_active = time.monotonic()
+            self._cond.notify()
+    
+    def take(self, timeout):
+        """The newest frame not yet processed, or None after timeout."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._frame is not None or self.closed, timeout)
+            data, self._frame = self._frame, None
+            self.last_active = time.monotonic()
+            return data
+    
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+    
+    def record(self, processed=0, dropped=0):
+        with self._cond:
+            self.processed += processed
+            self.dropped += dropped
+    
+    def stats(self):
+        with self._cond:
+            return {'received': self.received, 'processed': self.processed, 'dropped': self.dropped}
+
+
+class MoodStreamStore:
+    """Open streams by client key.
+    
+    A stream stays registered until its reader closes it; the TTL only drops
+    abandoned streams that nothing has pushed to or read from for ttl seconds.
+    An open reader counts as activity every MOOD_STREAM_KEEPALIVE seconds.
+    """
+    
+    def __init__(self, max_streams=MOOD_SESSION_MAX, ttl=MOOD_SESSION_TTL):
+        self.max_streams = max_streams
+        self.ttl = ttl
+        self._streams = {}
+        self._lock = threading.Lock()
+    
+    def open(self, key):
+        """The client's live stream, creating one if it has none (or it was closed)."""
+        now = time.monotonic()
+        with self._lock:
+            stream = self._streams.get(key)
+            if stream is None or stream.closed or now - stream.last_active > self.ttl:
+                if stream is not None:
+                    stream.close()
+                stream = MoodStream()
+                self._streams[key] = stream
+                self._evict(now)
+            return stream
+    
+    def close(self, key, stream):
+        """Close stream and unregister it, unless key already points at a newer one.
+        
+        Returns True if it was unregistered.
+        """
+        stream.close()
+        with self._lock:
+            if self._streams.get(key) is stream:
+                del self._streams[key]
+                return True
+        return False
+    
+    def _evict(self, now):
+        for key in [key for key, stream in self._streams.items() if now - stream.last_active > self.ttl]:
+            self._streams.pop(key).close()
+        excess = len(self._streams) - self.max_streams
+        if excess > 0:
+            # Least recently active first
+            for key in sorted(self._streams, key=lambda key: self._streams[key].last_active)[:excess]:
+                self._streams.pop(key).close()
+    
+    def __len__(self):
+        return len(self._streams)
+
+
+mood_streams = MoodStreamStore()
+
+MOOD_UNCHANGED = object()  # next_mood_update processed a frame but has nothing to send
+
+def next_mood_update(stream, state, timeout):
+    """Run detection on the stream's newest frame.
+    
+    Returns the result if the mood changed, MOOD_UNCHANGED if a frame was taken
+    but the mood did not change, or None if no frame arrived within timeout.
+    """
+    data = stream.take(timeout)
+    if data is None:
+        return None
+    frame = decode_array(np.frombuffer(data, np.uint8))
+    if frame is None:
+        return MOOD_UNCHANGED
+    try:
+        result = run_mood_inference([frame], [state])[0]
+    except InferenceBusy:
+        stream.record(dropped=1)
+        return MOOD_UNCHANGED
+    stream.record(processed=1)
+    if result['mood'] == stream.last_mood:
+        return MOOD_UNCHANGED
+    stream.last_mood = result['mood']
+    return dict(result, stream=stream.stats())
+
+def stream_key():
+    return get_mood_session_key({'client_id': binary_client_id()})
+
+@app.route('/mood_stream')
+def mood_stream():
+    """Server-Sent Events: a 'mood' event each time the client's smoothed mood changes."""
+    key = stream_key()
+    stream = mood_streams.open(key)
+    state = mood_states.get(key)
+    stream.last_mood = None
+    
+    def events():
+        try:
+            yield 'retry: 2000\n\n'
+            while not stream.closed:
+                update = next_mood_update(stream, state, MOOD_STREAM_KEEPALIVE)
+                if update is None:
+                    if not stream.closed:
+                        # Comment line; lets the server notice a dropped connection
+                        yield ': keepalive\n\n'
+                elif update is not MOOD_UNCHANGED:
+                    yield f"event: mood\ndata: {json.dumps(update)}\n\n"
+        finally:
+            # The client's smoothing state goes with its stream
+            if mood_streams.close(key, stream):
+                mood_states.discard(key)
+    
+    return app.response_class(events(), mimetype='text/event-stream',
+                              headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/mood_stream/frame', methods=['POST'])
+def mood_stream_frame():
+    """Queue a raw image body for the client's stream; replaces any frame still waiting."""
+    if request.content_length and request.content_length > MAX_FRAME_BYTES:
+        return jsonify({'error': 'Frame too large'}), 413
+    if length_required():
+        return jsonify({'error': 'Content-Length required'}), 411
+    try:
+        data = read_body_array()
+    except FrameTooLarge:
+        return jsonify({'error': 'Frame too large'}), 413
+    if not data.size:
+        return jsonify({'error': 'No frame'}), 400
+    mood_streams.open(stream_key()).push(data)
+    return '', 204
+
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
+
+if Sock is not None:
+    sock = Sock(app)
+    
+    @sock.route('/mood_ws')
+    def mood_ws(ws):
+        """WebSocket: binary messages are frames; mood changes are sent back as JSON text."""
+        key = stream_key()
+        stream = MoodStream()
+        state = mood_states.get(key)
+        
+        def receive_frames():
+            try:
+                while not stream.closed:
+                    message = ws.receive()
+                    if message is None:
+                        break
+                    if isinstance(message, (bytes, bytearray)) and len(message) <= MAX_FRAME_BYTES:
+                        stream.push(bytes(message))
+            except Exception:
+                pass
+            finally:
+                stream.close()
+        
+        threading.Thread(target=receive_frames, name='mood-ws-reader', daemon=True).start()
+        try:
+            while not stream.closed:
+                update = next_mood_update(stream, state, MOOD_STREAM_KEEPALIVE)
+                if update is not None and update is not MOOD_UNCHANGED:
+                    ws.send(json.dumps(update))
+        finally:
+            stream.close()
+            mood_states.discard(key)
+
+@app.route('/mood_classifier_stats')
+def mood_classifier_stats():
+    """Latency figures per loaded classifier backend (for this process)."""
+    if isinstance(mood_detector, LazyGlobal):
+        return jsonify({'active': None, 'executor': MOOD_EXECUTOR, 'backends': {}, 'loaded': False})
+    return jsonify({
+        'active': mood_detector.classifier.name,
+        'executor': MOOD_EXECUTOR,
+        'backends': {name: c.latency.snapshot() for name, c in mood_detector.classifiers.items()}
+    })
+
+@app.route('/startup_stats')
+def startup_stats():
+    """Import/init time per startup phase and of objects loaded lazily since (for this process)."""
+    return jsonify(startup_timer.report())
+
+@app.route('/http_client_stats')
+def http_client_stats():
+    """Latency and error counts per outbound API endpoint, and circuit state per host (for this process)."""
+    endpoints, circuits = http_client.stats()
+    return jsonify({'endpoints': endpoints, 'circuits': circuits})
+
+@app.route('/youtube_quota_stats')
+def youtube_quota_stats():
+    """Remaining YouTube quota per API key and search deduplication counts (for this process)."""
+    stats = youtube_quota.stats()
+    stats['merged_searches'] = youtube_flights.merged
+    stats['in_flight'] = youtube_flights.in_flight()
+    return jsonify(stats)
+
 @app.route('/set_mood', methods=['POST'])
 def set_mood():
     """Set mood manually."""
@@ -919,13 +2845,15 @@ def set_mood():
         if mood not in valid_moods:
             return jsonify({'error': 'Invalid mood'}), 400
         
-        mood_detector.last_mood = mood
-        mood_detector.mood_confidence = 1.0
+        state = mood_states.get(get_mood_session_key(data))
+        with state.lock:
+            state.last_mood = mood
+            state.mood_confidence = 1.0
+            state.last_result = None
         
-        # Save to user preferences if logged in
+        # Save to user preferences if logged in; buffered so rapid flips coalesce
         if current_user.is_authenticated:
-            current_user.preferred_mood = mood
-            db.session.commit()
+            preference_buffer.set(current_user.id, 'preferred_mood', mood)
         
         return jsonify({
             'mood': mood,
@@ -944,13 +2872,17 @@ def search_videos():
         mood = data.get('mood', 'neutral')
         shuffle = data.get('shuffle', False)
         
+        # Fan-out mode queries every available source at once and merges them
+        if data.get('fanout', SEARCH_FANOUT):
+            return search_fanout(mood, shuffle)
+        
         # Check user's preferred music service
         music_service = 'youtube'
         if current_user.is_authenticated:
             music_service = current_user.music_service
         
-        # If using Spotify with valid token, search Spotify
-        if music_service == 'spotify' and current_user.is_authenticated and current_user.spotify_token:
+        # If using Spotify, search Spotify (falls back to YouTube without a usable token)
+        if music_service == 'spotify':
             return search_spotify(mood, shuffle)
         
         # Otherwise use YouTube
@@ -961,108 +2893,116 @@ def search_videos():
 
 def search_youtube(mood, shuffle=False):
     """Search YouTube for mood-based videos with dynamic AI-powered queries."""
-    import random
-    
     # Get API key (from user if logged in, otherwise from env)
-    api_key = YOUTUBE_API_KEY
-    if current_user.is_authenticated and current_user.youtube_api_key:
-        api_key = current_user.youtube_api_key
+    api_key = youtube_api_key_for(current_user)
     
-    # If no API key, use dynamic fallback with random selection
-    if not api_key or api_key == 'YOUR_YOUTUBE_API_KEY_HERE':
-        # Use dynamic query selection for fallback too
-        fallback_videos = FALLBACK_VIDEOS.get(mood, FALLBACK_VIDEOS['neutral'])
-        # Shuffle and return varied results
-        random.shuffle(fallback_videos)
-        videos = format_videos(fallback_videos)
-        # Add some randomness to which videos are returned
-        if len(videos) > 10:
-            videos = videos[:10]
-        return jsonify({'videos': videos, 'mood': mood, 'mode': 'fallback'})
+    # If no API key, use a random selection from the fallback catalog
+    if not api_key:
+        return fallback_catalog.response(mood, FALLBACK_SAMPLE_SIZE, shuffle=True)
     
-    # Get dynamic search parameters
-    query, time_period = get_search_params(mood)
+    videos = youtube_mood_videos(mood, api_key)
     
-    params = {
-        'part': 'snippet',
-        'q': query + ' music',
-        'type': 'video',
-        'videoCategoryId': '10',
-        'maxResults': 15,
-        'key': api_key
-    }
-    
-    # Add time period for fresh content if available
-    if time_period:
-        params['publishedAfter'] = time_period
+    if videos is None:
+        return fallback_catalog.response(mood, YOUTUBE_MAX_RESULTS, shuffle=shuffle)
     
-    # Add variety in ordering - use relevance or viewCount randomly
-    ordering = 'relevance' if random.random() < 0.7 else 'viewCount'
-    params['order'] = ordering
-    
-    response = requests.get(YOUTUBE_SEARCH_URL, params=params)
-    
-    if response.status_code != 200:
-        videos = FALLBACK_VIDEOS.get(mood, FALLBACK_VIDEOS['neutral'])
-        if shuffle:
-            random.shuffle(videos)
-        videos = format_videos(videos)
-        return jsonify({'videos': videos, 'mood': mood, 'mode': 'fallback'})
-    
-    results = response.json()
+    if shuffle:
+        random.shuffle(videos)
     
-    if 'error' in results:
-        videos = FALLBACK_VIDEOS.get(mood, FALLBACK_VIDEOS['neutral'])
-        if shuffle:
-            random.shuffle(videos)
-        videos = format_videos(videos)
-        return jsonify({'videos': videos, 'mood': mood, 'mode': 'fallback'})
+    return jsonify({'videos': videos, 'mood': mood, 'mode': 'api'})
+
+def search_spotify(mood, shuffle=False):
+    """Search Spotify for mood-based tracks."""
+    token, user_id = spotify_tokens.token_for(current_user)
+    if not token:
+        return search_youtube(mood, shuffle)
     
-    videos = []
-    for item in results.get('items', []):
-        video_id = item['id']['videoId']
-        snippet = item['snippet']
-        videos.append({
-            'id': video_id,
-            'title': snippet['title'],
-            'channel': snippet['channelTitle'],
-            'thumbnail': snippet['thumbnails']['high']['url'] if 'high' in snippet['thumbnails'] else snippet['thumbnails']['default']['url'],
-            'youtube_url': f'https://www.youtube.com/watch?v={video_id}',
-            'embed_url': f'https://www.youtube.com/embed/{video_id}',
-            'type': 'youtube'
-        })
+    videos = spotify_mood_videos(mood, token, user_id)
+    if videos is None:
+        return search_youtube(mood, shuffle)
     
     if shuffle:
         random.shuffle(videos)
     
-    return jsonify({'videos': videos, 'mood': mood, 'mode': 'api'})
+    return jsonify({'videos': videos, 'mood': mood, 'mode': 'spotify'})
 
-def search_spotify(mood):
-    """Search Spotify for mood-based tracks."""
-    if not current_user.spotify_token:
-        return search_youtube(mood)
-    
-    # Spotify mood-based playlists/seed tracks
-    spotify_queries = {
-        'happy': 'happy bollywood party',
-        'sad': 'sad bollywood heartbreak',
-        'angry': 'rock metal punk',
-        'fear': 'dark ambient',
-        'surprise': 'party dance',
-        'disgust': 'alternative rock',
-        'neutral': 'chill lofi'
-    }
+# Search sources. Each takes plain values (no request context) and returns a
+# list of videos, or None when it has nothing to offer, so they can run on
+# worker threads.
+def youtube_api_key_for(user):
+    """The user's own YouTube API key, else the server's; None if neither is set."""
+    api_key = YOUTUBE_API_KEY
+    if user.is_authenticated and user.youtube_api_key:
+        api_key = user.youtube_api_key
+    if not api_key or api_key == 'YOUR_YOUTUBE_API_KEY_HERE':
+        return None
+    return api_key
+
+def interest_query_for(user, mood):
+    """Search query combining the user's top YouTube interests with the mood, or None."""
+    if not (user.is_authenticated and user.google_id and user.user_interests):
+        return None
+    try:
+        interests = json.loads(user.user_interests)
+    except ValueError:
+        return None
+    if not interests:
+        return None
+    # Generate search query from interests
+    interest_query = ' '.join(interests[:5])
+    # Combine with mood
+    mood_query = MOOD_QUERY_VARIATIONS.get(mood, MOOD_QUERY_VARIATIONS['neutral'])[0]
+    return f"{interest_query} {mood_query}"
+
+def youtube_mood_videos(mood, api_key):
+    """YouTube results for the mood's current dynamic query."""
+    # Get dynamic search parameters
+    query, time_period = get_search_params(mood)
     
-    query = spotify_queries.get(mood, spotify_queries['neutral'])
+    # Add variety in ordering - use relevance or viewCount randomly
+    ordering = 'relevance' if random.random() < 0.7 else 'viewCount'
     
-    headers = {'Authorization': f'Bearer {current_user.spotify_token}'}
+    params = youtube_search_params(query + ' music', api_key, time_period, ordering)
+    # Any recent results for the mood are an acceptable stand-in when quota is short
+    return fetch_youtube_videos(params, stale_key=('mood', mood))
+
+def youtube_interest_videos(combined_query, api_key):
+    """YouTube results for an interests + mood query."""
+    params = youtube_search_params(combined_query, api_key, order='relevance')
+    return fetch_youtube_videos(params, stale_key=('interests', combined_query))
+
+# Spotify mood-based playlists/seed tracks
+SPOTIFY_MOOD_QUERIES = {
+    'happy': 'happy bollywood party',
+    'sad': 'sad bollywood heartbreak',
+    'angry': 'rock metal punk',
+    'fear': 'dark ambient',
+    'surprise': 'party dance',
+    'disgust': 'alternative rock',
+    'neutral': 'chill lofi'
+}
+
+def spotify_mood_videos(mood, token, user_id=None):
+    """Spotify tracks for the mood, formatted like videos.
+    
+    With a user_id, a rejected token is refreshed once and the search retried.
+    """
+    query = SPOTIFY_MOOD_QUERIES.get(mood, SPOTIFY_MOOD_QUERIES['neutral'])
     
     # Search for tracks
-    search_url = f"{SPOTIFY_API_URL}/search?q={query}&type=track&limit=10"
-    response = requests.get(search_url, headers=headers)
+    for attempt in range(2):
+        try:
+            response = http_client.get(f"{SPOTIFY_API_URL}/search", headers={'Authorization': f'Bearer {token}'},
+                                       params={'q': query, 'type': 'track', 'limit': 10})
+        except requests.RequestException:
+            return None
+        if response.status_code != 401 or user_id is None or attempt:
+            break
+        token = spotify_tokens.refresh(user_id)
+        if not token:
+            return None
     
     if response.status_code != 200:
-        return search_youtube(mood)
+        return None
     
     results = response.json()
     
@@ -1080,8 +3020,105 @@ def search_spotify(mood):
             'spotify_url': item['external_urls']['spotify'],
             'type': 'spotify'
         })
+    return videos
+
+# Fan-out search: sources run concurrently and the response waits at most
+# SEARCH_FANOUT_BUDGET for them. Sources still running after that finish in
+# the background (filling the caches) but are left out of this response.
+SEARCH_FANOUT = os.environ.get('SEARCH_FANOUT', '0') == '1'  # default for /search_videos
+SEARCH_FANOUT_BUDGET = float(os.environ.get('SEARCH_FANOUT_BUDGET', '1.5'))  # seconds
+SEARCH_FANOUT_WORKERS = int(os.environ.get('SEARCH_FANOUT_WORKERS', '1000' if COOPERATIVE else '16'))  # greenlets when cooperative
+SEARCH_FANOUT_LIMIT = int(os.environ.get('SEARCH_FANOUT_LIMIT', '20'))  # videos in a merged response
+SEARCH_SOURCE_WEIGHTS = {'interests': 1.2, 'mood': 1.0, 'spotify': 1.0}
+SEARCH_RANK_OFFSET = 10  # reciprocal rank fusion constant; higher flattens rank differences
+
+search_pool = ThreadPoolExecutor(SEARCH_FANOUT_WORKERS, thread_name_prefix='search')
+
+def run_search_sources(sources, budget=SEARCH_FANOUT_BUDGET):
+    """Run (name, fn, *args) sources concurrently.
+    
+    Returns ({name: videos} for sources that answered within budget, [names that did not]).
+    """
+    futures = {search_pool.submit(fn, *args): name for name, fn, *args in sources}
+    done, pending = wait(futures, timeout=budget)
+    results = {}
+    for future in done:
+        try:
+            videos = future.result()
+        except Exception as e:
+            print(f"Search source {futures[future]} failed: {e}")
+            continue
+        if videos:
+            results[futures[future]] = videos
+    return results, sorted(futures[future] for future in pending)
+
+TITLE_BRACKETS = re.compile(r'[(\[][^)\]]*[)\]]')  # "(Official Video)", "[Lyrics]"
+TITLE_SEPARATORS = re.compile(r'\s+[-\u2013\u2014|]\s+')
+ARTIST_NOISE = re.compile(r'vevo$|\s*-\s*topic$|\bofficial\b')
+NON_WORD = re.compile(r'\W+')
+
+def normalize_artist(name):
+    return NON_WORD.sub('', ARTIST_NOISE.sub('', (name or '').lower().strip()))
+
+def song_key(video):
+    """(normalized title, artist) identifying a song across YouTube and Spotify results.
+    
+    Drops bracketed suffixes, punctuation and a leading "Artist - " matching the
+    channel, so "Ed Sheeran - Perfect (Official Video)" on EdSheeranVEVO and
+    Spotify's "Perfect" by Ed Sheeran share a key; same-titled songs by
+    different artists do not.
+    """
+    artist = normalize_artist(video.get('channel'))
+    parts = TITLE_SEPARATORS.split(TITLE_BRACKETS.sub(' ', video['title'].lower()))
+    if len(parts) > 1 and NON_WORD.sub('', parts[0]) == artist:
+        parts = parts[1:]
+    title = ' '.join(NON_WORD.sub(' ', ' '.join(parts)).split())
+    if not title:
+        return (video.get('type'), video['id'])
+    return (title, artist)
+
+def merge_search_results(results, limit=SEARCH_FANOUT_LIMIT):
+    """Dedupe and rank videos from several sources by weighted reciprocal rank."""
+    scores = {}
+    videos = {}
+    for name, source_videos in results.items():
+        weight = SEARCH_SOURCE_WEIGHTS.get(name, 1.0)
+        for rank, video in enumerate(source_videos):
+            # The same song from two sources counts once, with both scores
+            key = song_key(video)
+            scores[key] = scores.get(key, 0.0) + weight / (SEARCH_RANK_OFFSET + rank)
+            videos.setdefault(key, video)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [videos[key] for key in ranked]
+
+def search_fanout(mood, shuffle=False):
+    """Query interests, mood and Spotify at once and merge what returns within the budget."""
+    sources = []
+    api_key = youtube_api_key_for(current_user)
+    if api_key:
+        combined_query = interest_query_for(current_user, mood)
+        if combined_query:
+            sources.append(('interests', youtube_interest_videos, combined_query, api_key))
+        sources.append(('mood', youtube_mood_videos, mood, api_key))
+    spotify_token, spotify_user_id = spotify_tokens.token_for(current_user)
+    if spotify_token:
+        sources.append(('spotify', spotify_mood_videos, mood, spotify_token, spotify_user_id))
+    
+    results, timed_out = run_search_sources(sources)
+    videos = merge_search_results(results)
+    if not videos:
+        return fallback_catalog.response(mood, FALLBACK_SAMPLE_SIZE, shuffle=True)
     
-    return jsonify({'videos': videos, 'mood': mood, 'mode': 'spotify'})
+    if shuffle:
+        random.shuffle(videos)
+    
+    return jsonify({
+        'videos': videos,
+        'mood': mood,
+        'mode': 'fanout',
+        'sources': {name: len(source_videos) for name, source_videos in results.items()},
+        'timed_out': timed_out
+    })
 
 def format_videos(videos):
     """Format video data for frontend."""
@@ -1098,11 +3135,335 @@ def format_videos(videos):
         })
     return formatted
 
+# Fallback catalog: FALLBACK_VIDEOS, or a JSON ({mood: [video, ...]}) / JSON Lines
+# (one video with a 'mood' field per line) file given by FALLBACK_CATALOG_PATH.
+# Moods the file leaves out keep the built-in videos.
+FALLBACK_CATALOG_PATH = os.environ.get('FALLBACK_CATALOG_PATH', '')
+FALLBACK_SAMPLE_SIZE = int(os.environ.get('FALLBACK_SAMPLE_SIZE', '10'))
+
+
+class FallbackCatalog:
+    """Read-only, preformatted fallback videos per mood.
+    
+    Each video is formatted and serialized to JSON once at startup; requests
+    pick random indices and join the stored fragments, so nothing is copied,
+    shuffled or re-encoded per request.
+    """
+    
+    def __init__(self, videos_by_mood):
+        self._fragments = {}
+        for mood, videos in videos_by_mood.items():
+            seen = set()
+            unique = []
+            for video in videos:
+                if isinstance(video, dict) and video.get('id') and video['id'] not in seen:
+                    seen.add(video['id'])
+                    unique.append({'id': video['id'], 'title': video.get('title', ''),
+                                   'channel': video.get('channel', ''), 'thumbnail': video.get('thumbnail', '')})
+            self._fragments[mood] = tuple(json.dumps(video) for video in format_videos(unique))
+    
+    @classmethod
+    def load(cls, path=FALLBACK_CATALOG_PATH):
+        videos_by_mood = dict(FALLBACK_VIDEOS)
+        if not path:
+            return cls(videos_by_mood)
+        try:
+            with open(path, encoding='utf-8') as f:
+                if path.endswith('.jsonl'):
+                    loaded = {}
+                    for line in f:
+                        if line.strip():
+                            video = json.loads(line)
+                            # Lines that are not video objects are skipped
+                            if isinstance(video, dict):
+                                loaded.setdefault(video.get('mood', 'neutral'), []).append(video)
+                else:
+                    loaded = json.load(f)
+                    if not isinstance(loaded, dict):
+                        raise ValueError('expected an object of {mood: [video, ...]}')
+                    loaded = {mood: videos for mood, videos in loaded.items() if isinstance(videos, list)}
+            videos_by_mood.update(loaded)
+            print(f"Loaded fallback catalog from {path}: {sum(len(v) for v in loaded.values())} videos")
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            print(f"Could not load fallback catalog {path}, using built-in videos: {e}")
+        return cls(videos_by_mood)
+    
+    def _indices(self, mood, k, shuffle):
+        n = len(self._fragments[mood])
+        k = min(k, n)
+        # Sampling from a range draws k indices without copying the catalog
+        return random.sample(range(n), k) if shuffle else range(k)
+    
+    def _mood(self, mood):
+        return mood if self._fragments.get(mood) else 'neutral'
+    
+    def response(self, mood, k, shuffle=True):
+        """JSON response like search_youtube's, built from the stored fragments."""
+        catalog_mood = self._mood(mood)
+        fragments = self._fragments[catalog_mood]
+        videos = ', '.join(fragments[i] for i in self._indices(catalog_mood, k, shuffle))
+        body = f'{{"videos": [{videos}], "mood": {json.dumps(mood)}, "mode": "fallback"}}'
+        return app.response_class(body, mimetype='application/json')
+    
+    def __len__(self):
+        return sum(len(fragments) for fragments in self._fragments.values())
+
+
+startup_timer.mark('search_setup')
+fallback_catalog = FallbackCatalog.load()
+startup_timer.mark('fallback_catalog')
+
+# YouTube search result cache, keyed on the final search parameters. The
+# optional prewarm refreshes every mood's current query variant in the
+# background; each run costs 7 searches (700 quota units). The cache belongs to
+# one process, so every worker prewarms its own: 700 units x WEB_CONCURRENCY.
+YOUTUBE_CACHE_TTL = int(os.environ.get('YOUTUBE_CACHE_TTL', str(QUERY_WINDOW_SECONDS)))  # seconds
+YOUTUBE_CACHE_SIZE = int(os.environ.get('YOUTUBE_CACHE_SIZE', '512'))
+YOUTUBE_PREWARM_INTERVAL = int(os.environ.get('YOUTUBE_PREWARM_INTERVAL', '0'))  # seconds, 0 = off
+
+youtube_cache = TTLCache(YOUTUBE_CACHE_SIZE, YOUTUBE_CACHE_TTL)
+
+# Quota accounting per API key. search.list costs 100 of the default 10,000
+# daily units; each key's bucket refills evenly over the day. Once a bucket is
+# down to its reserve, searches with older (stale) results on hand are served
+# those instead, keeping the rest for searches that have nothing cached.
+# Buckets live in each process, so every serving process (WEB_CONCURRENCY
+# gunicorn workers) gets an equal share of the key's quota.
+YOUTUBE_DAILY_QUOTA = int(os.environ.get('YOUTUBE_DAILY_QUOTA', '10000'))  # units per key per day
+YOUTUBE_QUOTA_RESERVE = float(os.environ.get('YOUTUBE_QUOTA_RESERVE', '0.2'))  # fraction of the daily quota
+YOUTUBE_QUOTA_COOLDOWN = int(os.environ.get('YOUTUBE_QUOTA_COOLDOWN', '3600'))  # seconds a key rests after quotaExceeded
+YOUTUBE_STALE_TTL = int(os.environ.get('YOUTUBE_STALE_TTL', '86400'))  # seconds
+YOUTUBE_QUOTA_PROCESSES = max(int(os.environ.get('WEB_CONCURRENCY', '1')), 1)  # processes sharing each key
+YOUTUBE_SEARCH_COST = 100
+YOUTUBE_MAX_RESULTS = 15
+YOUTUBE_QUOTA_ERRORS = {'quotaExceeded', 'dailyLimitExceeded', 'rateLimitExceeded'}
+
+
+class QuotaBucket:
+    """Token bucket of quota units for one API key."""
+    
+    __slots__ = ('tokens', 'updated', 'blocked_until', 'spent', 'calls', 'rejected')
+    
+    def __init__(self, capacity, now):
+        self.tokens = float(capacity)
+        self.updated = now
+        self.blocked_until = 0.0
+        self.spent = 0
+        self.calls = 0
+        self.rejected = 0
+
+
+class YouTubeQuota:
+    """Per-key token buckets for this process's share of the YouTube Data API quota."""
+    
+    def __init__(self, daily_quota=YOUTUBE_DAILY_QUOTA, reserve=YOUTUBE_QUOTA_RESERVE, cooldown=YOUTUBE_QUOTA_COOLDOWN,
+                 processes=YOUTUBE_QUOTA_PROCESSES):
+        self.processes = processes
+        self.capacity = daily_quota / processes
+        self.reserve = self.capacity * reserve
+        self.rate = self.capacity / 86400.0  # units per second
+        self.cooldown = cooldown
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.stale_served = 0
+    
+    def _bucket(self, api_key, now):
+        bucket = self._buckets.get(api_key)
+        if bucket is None:
+            bucket = self._buckets[api_key] = QuotaBucket(self.capacity, now)
+            # Forget the least recently used user keys past a bound
+            while len(self._buckets) > 10000:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(api_key)
+        bucket.tokens = min(self.capacity, bucket.tokens + (now - bucket.updated) * self.rate)
+        bucket.updated = now
+        return bucket
+    
+    def acquire(self, api_key, cost, use_reserve=True):
+        """Take cost units from the key's bucket; False if it cannot cover them."""
+        now = time.time()
+        with self._lock:
+            bucket = self._bucket(api_key, now)
+            floor = 0 if use_reserve else self.reserve
+            if now < bucket.blocked_until or bucket.tokens - cost < floor:
+                bucket.rejected += 1
+                return False
+            bucket.tokens -= cost
+            bucket.spent += cost
+            bucket.calls += 1
+            return True
+    
+    def charge(self, api_key, cost):
+        """Deduct units already spent, even past the reserve."""
+        with self._lock:
+            bucket = self._bucket(api_key, time.time())
+            bucket.tokens = max(bucket.tokens - cost, 0.0)
+            bucket.spent += cost
+    
+    def exhaust(self, api_key):
+        """The API reported the key out of quota: empty it and rest it for the cooldown."""
+        now = time.time()
+        with self._lock:
+            bucket = self._bucket(api_key, now)
+            bucket.tokens = 0.0
+            bucket.blocked_until = now + self.cooldown
+        print(f"YouTube quota exhausted for key {mask_api_key(api_key)}")
+    
+    def served_stale(self):
+        with self._lock:
+            self.stale_served += 1
+    
+    def remaining(self, api_key):
+        with self._lock:
+            return int(self._bucket(api_key, time.time()).tokens)
+    
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            keys = {}
+            for api_key in list(self._buckets):
+                bucket = self._bucket(api_key, now)
+                keys[mask_api_key(api_key)] = {
+                    'remaining': int(bucket.tokens),
+                    'spent': bucket.spent,
+                    'calls': bucket.calls,
+                    'rejected': bucket.rejected,
+                    'blocked_for': max(int(bucket.blocked_until - now), 0)
+                }
+            stale_served = self.stale_served
+        return {'daily_quota': int(self.capacity), 'processes': self.processes, 'reserve': int(self.reserve),
+                'stale_served': stale_served, 'keys': keys}
+
+
+def mask_api_key(api_key):
+    return f"...{api_key[-4:]}" if api_key else None
+
+youtube_quota = YouTubeQuota()
+youtube_flights = SingleFlight()
+youtube_stale_cache = TTLCache(YOUTUBE_CACHE_SIZE, YOUTUBE_STALE_TTL)
+
+def youtube_search_params(query, api_key, time_period=None, order='relevance'):
+    """Build search.list parameters for a music video search."""
+    params = {
+        'part': 'snippet',
+        'q': query,
+        'type': 'video',
+        'videoCategoryId': '10',
+        'maxResults': YOUTUBE_MAX_RESULTS,
+        'key': api_key,
+        'order': order
+    }
+    if time_period:
+        params['publishedAfter'] = time_period
+    return params
+
+def youtube_cache_key(params):
+    # The API key is left out: every key gets the same results
+    return (params['q'], params.get('publishedAfter'), params['order'], params['videoCategoryId'], params['maxResults'])
+
+def format_search_items(results):
+    """Format search.list items for the frontend."""
+    videos = []
+    for item in results.get('items', []):
+        video_id = item['id']['videoId']
+        snippet = item['snippet']
+        videos.append({
+            'id': video_id,
+            'title': snippet['title'],
+            'channel': snippet['channelTitle'],
+            'thumbnail': snippet['thumbnails']['high']['url'] if 'high' in snippet['thumbnails'] else snippet['thumbnails']['default']['url'],
+            'youtube_url': f'https://www.youtube.com/watch?v={video_id}',
+            'embed_url': f'https://www.youtube.com/embed/{video_id}',
+            'type': 'youtube'
+        })
+    return videos
+
+def fetch_youtube_videos(params, use_cache=True, stale_key=None):
+    """Run a YouTube search, serving repeats from the cache; None if nothing can be served.
+    
+    Identical concurrent searches share one API call. When the key's quota runs
+    low or the call fails, the last results stored under stale_key (default: the
+    cache key) are served instead. Returns a fresh list each time, so callers
+    may shuffle it.
+    """
+    key = youtube_cache_key(params)
+    if use_cache:
+        videos = youtube_cache.get(key)
+        if videos is not None:
+            return list(videos)
+    
+    videos = youtube_flights.run(key, call_youtube_search, params, stale_key or key)
+    return list(videos) if videos is not None else None
+
+def call_youtube_search(params, stale_key):
+    """One search.list call, charged to the API key's quota bucket."""
+    stale = youtube_stale_cache.get(stale_key)
+    # Below the reserve, spend quota only on searches nothing else can answer
+    if not youtube_quota.acquire(params['key'], YOUTUBE_SEARCH_COST, use_reserve=stale is None):
+        if stale is not None:
+            youtube_quota.served_stale()
+        return stale
+    
+    try:
+        response = http_client.get(YOUTUBE_SEARCH_URL, params=params)
+    except requests.RequestException as e:
+        print(f"YouTube search failed: {e}")
+        return stale
+    if getattr(response, 'hedged', False):
+        # A hedged duplicate was sent; YouTube charges both
+        youtube_quota.charge(params['key'], YOUTUBE_SEARCH_COST)
+    
+    try:
+        results = response.json()
+    except ValueError:
+        results = {}
+    error = results.get('error')
+    if response.status_code != 200 or error:
+        reasons = {e.get('reason') for e in error.get('errors', [])} if isinstance(error, dict) else set()
+        if reasons & YOUTUBE_QUOTA_ERRORS:
+            youtube_quota.exhaust(params['key'])
+        return stale
+    
+    videos = tuple(format_search_items(results))
+    youtube_cache.set(youtube_cache_key(params), videos)
+    youtube_stale_cache.set(stale_key, videos)
+    return videos
+
+def prewarm_youtube_cache():
+    """Fetch each mood's current query variant (recent, by relevance) into the cache."""
+    now = int(time.time())
+    for mood in MOOD_QUERY_VARIATIONS:
+        query = generate_dynamic_query(mood, now)
+        params = youtube_search_params(query + ' music', YOUTUBE_API_KEY, window_time_period(now), 'relevance')
+        fetch_youtube_videos(params, use_cache=False)
+
+def _youtube_prewarm_loop():
+    while True:
+        try:
+            prewarm_youtube_cache()
+        except Exception as e:
+            print(f"Error prewarming YouTube cache: {e}")
+        time.sleep(YOUTUBE_PREWARM_INTERVAL)
+
+_youtube_prewarm_pid = None
+
+@app.before_request
+def start_youtube_prewarm():
+    """Start the prewarm loop in each serving process (threads don't survive fork).
+    
+    Each process warms its own cache and pays for it from its share of the quota.
+    """
+    global _youtube_prewarm_pid
+    if _youtube_prewarm_pid == os.getpid() or not (YOUTUBE_PREWARM_INTERVAL > 0 and YOUTUBE_API_KEY):
+        return
+    _youtube_prewarm_pid = os.getpid()
+    threading.Thread(target=_youtube_prewarm_loop, name='youtube-prewarm', daemon=True).start()
+
 @app.route('/search_by_text', methods=['POST'])
 def search_by_text():
     """Search for videos based on text description with AI-powered dynamic queries."""
     try:
-        import random
         data = request.get_json()
         text = data.get('text', '').lower().strip()
         
@@ -1143,14 +3504,20 @@ def search_by_text():
 def get_api_key_status():
     """Check if API key is configured."""
     has_key = bool(YOUTUBE_API_KEY and YOUTUBE_API_KEY != 'YOUR_YOUTUBE_API_KEY_HERE')
+    api_key = YOUTUBE_API_KEY
     
     if current_user.is_authenticated and current_user.youtube_api_key:
         has_key = True
+        api_key = current_user.youtube_api_key
     
     # Check if Google OAuth is configured
     google_oauth_configured = bool(GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET)
     
-    return jsonify({'configured': has_key, 'google_oauth': google_oauth_configured})
+    return jsonify({
+        'configured': has_key,
+        'google_oauth': google_oauth_configured,
+        'quota_remaining': youtube_quota.remaining(api_key) if has_key else None
+    })
 
 # Playlist Routes
 @app.route('/create_playlist', methods=['POST'])
@@ -1169,8 +3536,7 @@ def create_playlist():
         playlist = Playlist(
             name=name,
             mood=mood,
-            user_id=current_user.id,
-            videos='[]'
+            user_id=current_user.id
         )
         db.session.add(playlist)
         db.session.commit()
@@ -1187,30 +3553,61 @@ def create_playlist():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+PLAYLIST_PAGE_MAX = 100
+PLAYLIST_STREAM_CHUNK = 25  # playlists whose tracks are loaded per query while streaming
+
 @app.route('/get_playlists', methods=['GET'])
 @login_required
 def get_playlists():
-    """Get all playlists for the current user."""
+    """Get the current user's playlists as a streamed JSON body.
+    
+    Query params: limit (page size, max 100; all playlists when omitted),
+    cursor (next_cursor from the previous page) and summary=1 (track count and
+    first thumbnail instead of the full video lists).
+    """
     try:
-        playlists = Playlist.query.filter_by(user_id=current_user.id).all()
-        result = []
-        for p in playlists:
-            videos = []
-            if p.videos:
-                try:
-                    videos = json.loads(p.videos)
-                except:
-                    videos = []
-            result.append({
-                'id': p.id,
-                'name': p.name,
-                'mood': p.mood,
-                'videos': videos,
-                'created_at': p.created_at.isoformat() if p.created_at else None
-            })
-        return jsonify({'playlists': result})
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor', type=int)
+        summary = request.args.get('summary', '').lower() in ('1', 'true', 'yes')
+        
+        query = Playlist.query.filter_by(user_id=current_user.id)
+        if cursor:
+            query = query.filter(Playlist.id > cursor)
+        query = query.order_by(Playlist.id)
+        
+        next_cursor = None
+        if limit:
+            limit = max(1, min(limit, PLAYLIST_PAGE_MAX))
+            playlists = query.limit(limit + 1).all()
+            if len(playlists) > limit:
+                playlists = playlists[:limit]
+                next_cursor = playlists[-1].id
+        else:
+            playlists = query.all()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        yield '{"playlists": ['
+        for start in range(0, len(playlists), PLAYLIST_STREAM_CHUNK):
+            chunk = playlists[start:start + PLAYLIST_STREAM_CHUNK]
+            ids = [p.id for p in chunk]
+            details = playlists_summaries(ids) if summary else playlists_videos(ids)
+            for i, p in enumerate(chunk):
+                entry = {
+                    'id': p.id,
+                    'name': p.name,
+                    'mood': p.mood,
+                    'created_at': p.created_at.isoformat() if p.created_at else None
+                }
+                if summary:
+                    entry.update(details[p.id])
+                else:
+                    entry['videos'] = details[p.id]
+                yield (',' if start or i else '') + json.dumps(entry)
+        yield '], "next_cursor": %s}' % json.dumps(next_cursor)
+    
+    return app.response_class(stream_with_context(generate()), mimetype='application/json')
 
 @app.route('/add_to_playlist', methods=['POST'])
 @login_required
@@ -1228,24 +3625,17 @@ def add_to_playlist():
         if not playlist:
             return jsonify({'error': 'Playlist not found'}), 404
         
-        # Add video to playlist
-        videos = []
-        if playlist.videos:
-            try:
-                videos = json.loads(playlist.videos)
-            except:
-                videos = []
-        
-        # Check if video already exists
-        if not any(v.get('id') == video.get('id') for v in videos):
-            videos.append(video)
-            playlist.videos = json.dumps(videos)
-            db.session.commit()
+        if not video.get('id'):
+            return jsonify({'error': 'Video ID is required'}), 400
         
-        return jsonify({
-            'success': True,
-            'videos': videos
-        })
+        # Adding twice is a no-op
+        added = append_playlist_item(playlist.id, video)
+        
+        result = {'success': True, 'added': added}
+        # Clients that track the list themselves can skip re-reading it
+        if data.get('return_videos', True):
+            result['videos'] = playlist_videos(playlist.id)
+        return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1265,22 +3655,13 @@ def remove_from_playlist():
         if not playlist:
             return jsonify({'error': 'Playlist not found'}), 404
         
-        # Remove video from playlist
-        videos = []
-        if playlist.videos:
-            try:
-                videos = json.loads(playlist.videos)
-            except:
-                videos = []
-        
-        videos = [v for v in videos if v.get('id') != video_id]
-        playlist.videos = json.dumps(videos)
+        PlaylistItem.query.filter_by(playlist_id=playlist.id, video_id=str(video_id)).delete()
         db.session.commit()
         
-        return jsonify({
-            'success': True,
-            'videos': videos
-        })
+        result = {'success': True}
+        if data.get('return_videos', True):
+            result['videos'] = playlist_videos(playlist.id)
+        return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1299,6 +3680,7 @@ def delete_playlist():
         if not playlist:
             return jsonify({'error': 'Playlist not found'}), 404
         
+        PlaylistItem.query.filter_by(playlist_id=playlist.id).delete()
         db.session.delete(playlist)
         db.session.commit()
         
@@ -1315,12 +3697,7 @@ def play_playlist(playlist_id):
         if not playlist:
             return jsonify({'error': 'Playlist not found'}), 404
         
-        videos = []
-        if playlist.videos:
-            try:
-                videos = json.loads(playlist.videos)
-            except:
-                videos = []
+        videos = playlist_videos(playlist.id)
         
         return jsonify({
             'playlist': {
@@ -1333,6 +3710,38 @@ def play_playlist(playlist_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+startup_timer.mark('routes')
+print(startup_timer.summary())
+
+def create_app(init_schema=None):
+    """Production entry point (see wsgi.py), called once before workers fork.
+    
+    The fallback catalog and query tables are built at import; the vision stack
+    (OpenCV, cascades, classifiers) is loaded lazily, so it is loaded here unless
+    inference runs in a process pool. A preloading server shares all of them
+    with its workers copy-on-write. Schema
+    setup runs here once (unless INIT_DB=0) rather than in every worker;
+    gunicorn.conf.py sets INIT_DB=0 for workers that load the app themselves.
+    """
+    global _db_init_pending
+    if init_schema is None:
+        init_schema = INIT_DB
+    if init_schema:
+        init_db()
+    _db_init_pending = False
+    # Load the vision stack now so forked workers share it; with the process
+    # executor the inference processes load their own and the web process never does
+    if isinstance(mood_detector, LazyGlobal) and mood_executor.mode != 'process':
+        mood_detector.load()
+        print(f"Preloaded mood detector in {round(startup_timer.lazy.get('mood_detector', 0) * 1000, 1)}ms")
+    # Workers must open their own database connections
+    with app.app_context():
+        db.engine.dispose()
+    # Move everything loaded so far out of the collector's reach, so GC passes
+    # in the workers don't write to (and un-share) those pages
+    gc.freeze()
+    return app
+
 if __name__ == '__main__':
     # Run on plain HTTP for simplicity - works without SSL certificates
     print("Starting MoodMusic on http://0.0.0.0:5000")
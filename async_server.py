@@ -0,0 +1,30 @@
+"""
+Cooperative MoodMusic server: gevent patches the standard library before the
+app is imported, so the outbound YouTube, Spotify and Google calls made by the
+search and OAuth routes yield to other requests instead of holding a thread.
+Mood inference runs on native threads (MOOD_EXECUTOR=thread, the default here).
+
+    pip install gevent
+    python async_server.py
+
+or with gunicorn: gunicorn -k gevent --worker-connections 1000 app:app
+"""
+
+from gevent import monkey
+monkey.patch_all()
+
+import os
+
+from gevent.pywsgi import WSGIServer
+
+from app import app
+
+ASYNC_HOST = os.environ.get('HOST', '0.0.0.0')
+ASYNC_PORT = int(os.environ.get('PORT', '5000'))
+ASYNC_MAX_CONNECTIONS = int(os.environ.get('ASYNC_MAX_CONNECTIONS', '1000'))  # concurrent requests
+
+
+if __name__ == '__main__':
+    from gevent.pool import Pool
+    print(f"Starting MoodMusic (gevent) on http://{ASYNC_HOST}:{ASYNC_PORT}")
+    WSGIServer((ASYNC_HOST, ASYNC_PORT), app, spawn=Pool(ASYNC_MAX_CONNECTIONS)).serve_forever()
@@ -0,0 +1,83 @@
+"""
+Database write load test: N concurrent writers commit preference updates
+against the configured database (DATABASE_URL, default the local SQLite file)
+and the script reports commit throughput, latency and lock errors.
+
+Usage: python db_load_test.py --writers 8 --seconds 10
+"""
+
+import argparse
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+
+from app import app, db, init_db, User, LatencyStats
+
+MOODS = ['happy', 'sad', 'angry', 'fear', 'surprise', 'disgust', 'neutral']
+
+
+def ensure_users(count):
+    """Create (or reuse) one load-test user per writer; returns their ids."""
+    ids = []
+    with app.app_context():
+        for i in range(count):
+            email = f'loadtest{i}@example.com'
+            user = User.query.filter_by(email=email).first()
+            if not user:
+                user = User(username=f'loadtest{i}', email=email)
+                db.session.add(user)
+                db.session.commit()
+            ids.append(user.id)
+    return ids
+
+
+def writer(user_id, deadline, stats, errors):
+    with app.app_context():
+        i = 0
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                user = db.session.get(User, user_id)
+                user.preferred_mood = MOODS[i % len(MOODS)]
+                db.session.commit()
+                stats.record(time.perf_counter() - start)
+            except OperationalError as e:
+                db.session.rollback()
+                stats.record(time.perf_counter() - start, error=True)
+                errors.append(str(e.orig))
+            i += 1
+        db.session.remove()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--writers', type=int, default=8, help='concurrent writer threads')
+    parser.add_argument('--seconds', type=float, default=10, help='test duration')
+    args = parser.parse_args()
+    
+    # Importing the app leaves the schema alone; create or update it first
+    init_db()
+    user_ids = ensure_users(args.writers)
+    stats = LatencyStats(window=100000)
+    errors = []
+    deadline = time.monotonic() + args.seconds
+    threads = [threading.Thread(target=writer, args=(uid, deadline, stats, errors)) for uid in user_ids]
+    
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+    
+    snapshot = stats.snapshot()
+    print(f"Database: {app.config['SQLALCHEMY_DATABASE_URI']}")
+    print(f"Writers: {args.writers}, duration: {elapsed:.1f}s")
+    print(f"Commits: {snapshot['calls'] - snapshot['errors']} ({(snapshot['calls'] - snapshot['errors']) / elapsed:.0f}/s)")
+    print(f"Latency: p50 {snapshot['p50_ms']} ms, p95 {snapshot['p95_ms']} ms")
+    print(f"Errors: {snapshot['errors']}" + (f" (e.g. {errors[0]})" if errors else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""
+Gunicorn settings for MoodMusic (see Procfile).
+
+The app is preloaded in the master, so the cascades, classifiers and fallback
+catalog are loaded once and shared by all workers.
+"""
+
+import os
+import subprocess
+import sys
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+# The app splits per-process budgets (YouTube quota) by the worker count
+os.environ['WEB_CONCURRENCY'] = str(workers)
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))  # per worker (gthread)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))  # seconds
+graceful_timeout = 30
+accesslog = '-'
+
+# gevent workers patch the standard library when they start, which is too late
+# for an app imported in the master; they load the app themselves instead
+preload_app = worker_class != 'gevent'
+
+if not preload_app:
+    init_db = os.environ.get('INIT_DB', '1') == '1'
+    # Workers must not each set up the schema; the master does it once, in a
+    # separate process so nothing is imported here before gevent patches it
+    os.environ['INIT_DB'] = '0'
+
+    def on_starting(server):
+        if init_db:
+            subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], check=True)
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Keep the tests off the developer's database and away from real API keys
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+os.environ.setdefault('MOOD_EXECUTOR', 'inline')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,55 @@
+import cv2
+import numpy as np
+
+import app as moodmusic
+
+
+class BatchOfOneNet:
+    """Stands in for a cv2.dnn model exported with a fixed batch size of 1."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+
+    def setPreferableBackend(self, backend):
+        pass
+
+    def setPreferableTarget(self, target):
+        pass
+
+    def setInput(self, blob):
+        self.blob = blob
+
+    def forward(self):
+        self.batches.append(len(self.blob))
+        if self.fail or len(self.blob) != 1:
+            raise cv2.error('batch size must be 1')
+        # FER2013 order: index 3 is happy
+        return np.eye(7, dtype=np.float32)[[3]]
+
+
+def test_dnn_falls_back_to_single_face_passes(monkeypatch):
+    net = BatchOfOneNet()
+    monkeypatch.setattr(cv2.dnn, 'readNet', lambda path: net)
+    classifier = moodmusic.DnnClassifier(model_path='batch1.onnx')
+
+    moods, confidences = classifier.predict(np.zeros((3, 48, 48), dtype=np.uint8))
+
+    assert moods == ['happy'] * 3
+    assert confidences == [1.0] * 3
+    assert not classifier.batched
+    # Later batches skip straight to per-face passes
+    net.batches.clear()
+    classifier.predict(np.zeros((2, 48, 48), dtype=np.uint8))
+    assert net.batches == [1, 1]
+
+
+def test_model_failing_warmup_falls_back_to_heuristic(monkeypatch):
+    monkeypatch.setattr(cv2.dnn, 'readNet', lambda path: BatchOfOneNet(fail=True))
+    monkeypatch.setattr(moodmusic, 'MOOD_MODEL_PATH', 'broken.onnx')
+
+    classifiers = moodmusic.load_classifiers()
+    assert list(classifiers) == ['heuristic']
+
+    detector = moodmusic.MoodDetector(classifier='dnn')
+    assert detector.classifier.name == 'heuristic'
@@ -0,0 +1,51 @@
+import numpy as np
+
+import app as moodmusic
+
+
+def make_state(face_box):
+    state = moodmusic.MoodState()
+    state.track.face_box = face_box
+    return state
+
+
+def face_frame(seed=0):
+    rng = np.random.default_rng(seed)
+    frame = np.full((480, 640, 3), 90, dtype=np.uint8)
+    # A textured 100x100 "face" at (270, 190)
+    frame[190:290, 270:370] = rng.integers(100, 200, (100, 100, 3), dtype=np.uint8)
+    return frame
+
+
+def test_unchanged_frame_reuses_result():
+    box = (270, 190, 100, 100)
+    state = make_state(box)
+    frame = face_frame()
+    moodmusic.remember_mood_result(state, moodmusic.frame_thumbnail(frame, box), {'mood': 'happy'})
+
+    cached = moodmusic.cached_mood_result(state, moodmusic.frame_thumbnail(frame.copy(), box))
+
+    assert cached == {'mood': 'happy', 'cached': True}
+
+
+def test_face_region_change_runs_inference_again():
+    box = (270, 190, 100, 100)
+    state = make_state(box)
+    frame = face_frame()
+    moodmusic.remember_mood_result(state, moodmusic.frame_thumbnail(frame, box), {'mood': 'neutral'})
+
+    # Only the mouth changes, by 60 grey levels
+    changed = frame.copy()
+    changed[265:285, 295:345] = np.clip(changed[265:285, 295:345].astype(int) + 60, 0, 255)
+
+    assert moodmusic.cached_mood_result(state, moodmusic.frame_thumbnail(changed, box)) is None
+
+
+def test_noise_frames_are_not_cached():
+    state = make_state(None)
+    rng = np.random.default_rng(1)
+    first = rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)
+    second = rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)
+    moodmusic.remember_mood_result(state, moodmusic.frame_thumbnail(first), {'mood': 'neutral'})
+
+    assert moodmusic.cached_mood_result(state, moodmusic.frame_thumbnail(second)) is None
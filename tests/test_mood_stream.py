@@ -0,0 +1,57 @@
+import time
+
+import cv2
+import numpy as np
+
+import app as moodmusic
+
+
+def frame_bytes():
+    ok, encoded = cv2.imencode('.png', np.full((64, 64, 3), 120, dtype=np.uint8))
+    assert ok
+    return encoded.tobytes()
+
+
+def test_open_stream_outlives_ttl(monkeypatch):
+    monkeypatch.setattr(moodmusic, 'mood_streams', moodmusic.MoodStreamStore(ttl=0.3))
+    monkeypatch.setattr(moodmusic, 'MOOD_STREAM_KEEPALIVE', 0.05)
+    client = moodmusic.app.test_client()
+
+    response = client.get('/mood_stream?client_id=ttl', buffered=False)
+    events = iter(response.response)
+    assert next(events) == b'retry: 2000\n\n'
+    stream = moodmusic.mood_streams.open('client:ttl')
+
+    # Keepalives while idle for longer than the TTL
+    deadline = time.monotonic() + 0.6
+    while time.monotonic() < deadline:
+        assert next(events) == b': keepalive\n\n'
+
+    assert moodmusic.mood_streams.open('client:ttl') is stream
+    response_frame = client.post('/mood_stream/frame?client_id=ttl', data=frame_bytes(), content_type='image/png')
+    assert response_frame.status_code == 204
+    assert next(events).startswith(b'event: mood\n')
+
+    response.close()
+    assert stream.closed
+    assert len(moodmusic.mood_streams) == 0
+
+
+def test_abandoned_stream_is_replaced_after_ttl():
+    streams = moodmusic.MoodStreamStore(ttl=0.1)
+    stream = streams.open('client:gone')
+    time.sleep(0.2)
+
+    assert streams.open('client:gone') is not stream
+    assert stream.closed
+
+
+def test_closing_stream_discards_mood_state():
+    client = moodmusic.app.test_client()
+    response = client.get('/mood_stream?client_id=bye', buffered=False)
+    next(iter(response.response))
+    state = moodmusic.mood_states.get('client:bye')
+
+    response.close()
+
+    assert moodmusic.mood_states.get('client:bye') is not state
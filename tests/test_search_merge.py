@@ -0,0 +1,39 @@
+import app as moodmusic
+
+
+def video(id, title, channel, type='youtube'):
+    return {'id': id, 'title': title, 'channel': channel, 'type': type}
+
+
+def test_same_title_by_different_artists_stays_separate():
+    results = {
+        'mood': [video('a', 'Hello', 'Adele')],
+        'spotify': [video('b', 'Hello', 'Lionel Richie', type='spotify')],
+    }
+
+    merged = moodmusic.merge_search_results(results)
+
+    assert sorted(v['id'] for v in merged) == ['a', 'b']
+
+
+def test_same_song_across_sources_is_merged():
+    results = {
+        'mood': [video('yt', 'Ed Sheeran - Perfect (Official Video)', 'EdSheeranVEVO')],
+        'spotify': [video('sp', 'Perfect', 'Ed Sheeran', type='spotify')],
+        'interests': [video('yt2', 'Perfect [Lyrics]', 'Ed Sheeran')],
+    }
+
+    merged = moodmusic.merge_search_results(results)
+
+    assert [v['id'] for v in merged] == ['yt']
+
+
+def test_merged_song_ranks_above_single_source_songs():
+    results = {
+        'mood': [video('x', 'Other Song', 'Someone'), video('yt', 'Roar (Official)', 'Katy Perry')],
+        'spotify': [video('sp', 'Roar', 'Katy Perry', type='spotify')],
+    }
+
+    merged = moodmusic.merge_search_results(results)
+
+    assert merged[0]['id'] == 'yt'
@@ -0,0 +1,13 @@
+"""
+Production WSGI entry point for MoodMusic.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Schema setup runs once here, in the gunicorn master, instead of in every worker;
+set INIT_DB=0 to skip it when the schema is managed separately
+(flask --app app init-db).
+"""
+
+from app import create_app
+
+app = create_app()